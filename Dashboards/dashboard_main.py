@@ -298,7 +298,7 @@ def user_dashboard():
                 if r["status"].lower() == "approve":
                     with cols[4]:
                         if "ec2" in r["text"].lower():
-                            st.link_button("Access EC2", "http://localhost:8502", use_container_width=True)
+                            st.link_button("Access EC2", f"http://localhost:8502/?request_id={r['id']}", use_container_width=True)
                         elif "s3" in r["text"].lower():
                             st.link_button("Access S3", "http://localhost:8503", use_container_width=True)
                         else:
@@ -1,10 +1,25 @@
 import asyncio
 import asyncssh
-import subprocess
 import json
+import os
+import re
+import shutil
+import sys
 import time
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import uuid
+from collections import deque
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+# Terraform job runner shared with the S3 backend (common/ at the repo root)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.terraform_jobs import (
+    OutputsCache, dir_lock, forget_dir_lock, router as jobs_router, start_job, terraform, terraform_init,
+    wait_until, workspaces_router,
+)
 
 app = FastAPI()
 
@@ -20,117 +35,944 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.include_router(jobs_router)
 
 # ========== CONFIG ==========
 TERRAFORM_DIR = r"\EC2"
 PEM_KEY_PATH = r"path-to-pem-file"
 SSH_USER = "ubuntu"
 
+# Pooled SSH connections: keepalive interval, idle eviction, sessions per connection
+SSH_KEEPALIVE_SECONDS = float(os.getenv("SSH_KEEPALIVE_SECONDS", "30"))
+SSH_IDLE_TTL = float(os.getenv("SSH_IDLE_TTL", "300"))
+SSH_MAX_CHANNELS = int(os.getenv("SSH_MAX_CHANNELS", "8"))
 
-# ========== EC2 MANAGEMENT ==========
+# Terminal output path: bytes per channel read, max bytes per WebSocket frame,
+# coalescing window during output bursts, and chunks queued before the SSH
+# channel is throttled
+TERM_READ_BYTES = int(os.getenv("TERM_READ_BYTES", "4096"))
+TERM_FRAME_BYTES = int(os.getenv("TERM_FRAME_BYTES", "65536"))
+TERM_COALESCE_SECONDS = float(os.getenv("TERM_COALESCE_SECONDS", "0.005"))
+TERM_QUEUE_CHUNKS = int(os.getenv("TERM_QUEUE_CHUNKS", "64"))
 
-@app.post("/launch_ec2/")
-async def launch_ec2():
-    """Launch EC2 instance using Terraform."""
+# Detachable terminal sessions: how long a shell survives without a WebSocket,
+# how many may exist at once, and scrollback kept per session for replay
+SESSION_GRACE_SECONDS = float(os.getenv("SESSION_GRACE_SECONDS", "600"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "50"))
+SESSION_SCROLLBACK_BYTES = int(os.getenv("SESSION_SCROLLBACK_BYTES", str(256 * 1024)))
+
+# /fleet/exec: default and maximum hosts in flight, per-host timeout and
+# how much of each host's stdout/stderr is returned
+FLEET_CONCURRENCY = int(os.getenv("FLEET_CONCURRENCY", "20"))
+FLEET_MAX_CONCURRENCY = int(os.getenv("FLEET_MAX_CONCURRENCY", "100"))
+FLEET_HOST_TIMEOUT = float(os.getenv("FLEET_HOST_TIMEOUT", "60"))
+FLEET_MAX_OUTPUT_CHARS = int(os.getenv("FLEET_MAX_OUTPUT_CHARS", "65536"))
+
+# Each approved request gets its own working directory (and state file)
+# under WORKSPACES_DIR, rendered from the Terraform files in TEMPLATE_DIR,
+# which ships next to this file. TERRAFORM_DIR is only read for state left
+# there by older versions.
+EC2_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(EC2_DIR, "template")
+WORKSPACES_DIR = os.path.join(EC2_DIR, "workspaces")
+# VPC, subnet, gateway and routes shared by all workspaces (applied once)
+NETWORK_DIR = os.path.join(EC2_DIR, "network")
+DEFAULT_REQUEST_ID = "default"
+
+# How long a new instance may take to report an IP and accept SSH
+READY_TIMEOUT_SECONDS = float(os.getenv("READY_TIMEOUT_SECONDS", "300"))
+# Readiness polls back off from the first delay to the second (seconds)
+READY_POLL_DELAYS = {"initial_delay": 0.5, "max_delay": 8.0}
+
+# Warm pool of pre-applied, SSH-ready instances (disabled when WARM_POOL_MIN is 0).
+# The pool grows towards WARM_POOL_MAX on misses and shrinks back to
+# WARM_POOL_MIN as instances sit idle longer than WARM_POOL_IDLE_TTL seconds.
+WARM_POOL_MIN = int(os.getenv("WARM_POOL_MIN", "0"))
+WARM_POOL_MAX = int(os.getenv("WARM_POOL_MAX", "2"))
+WARM_POOL_IDLE_TTL = float(os.getenv("WARM_POOL_IDLE_TTL", "3600"))
+WARM_POOL_CHECK_SECONDS = float(os.getenv("WARM_POOL_CHECK_SECONDS", "30"))
+# Failed refills back off exponentially from WARM_POOL_CHECK_SECONDS up to this
+WARM_POOL_MAX_BACKOFF_SECONDS = float(os.getenv("WARM_POOL_MAX_BACKOFF_SECONDS", "1800"))
+
+
+# ========== READINESS ==========
+
+async def _public_ip(cwd):
+    state = outputs_cache.get(cwd)
+    return state["outputs"].get("public_ip") if state else None
+
+
+async def ssh_port_open(ip, port=22, timeout=3.0):
+    """True once a TCP connection to ip:port succeeds."""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
     try:
-        subprocess.run(["terraform", "init"], cwd=TERRAFORM_DIR, check=True)
-        subprocess.run(["terraform", "apply", "-auto-approve"], cwd=TERRAFORM_DIR, check=True)
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def wait_for_instance(job, cwd):
+    """Poll the Terraform output for an IP, then probe SSH; record time-to-ready."""
+    start = time.perf_counter()
+    deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+    ip = await wait_until(lambda: _public_ip(cwd), READY_TIMEOUT_SECONDS, "public IP", job, **READY_POLL_DELAYS)
+    await wait_until(
+        lambda: ssh_port_open(ip), max(0.0, deadline - time.monotonic()), f"SSH on {ip}:22", job,
+        **READY_POLL_DELAYS,
+    )
+    job.timings["ready_wait"] = round(time.perf_counter() - start, 3)
+    job.timings["time_to_ready"] = round(time.time() - job.started_at, 3)
+    return ip
+
+
+# ========== WORKSPACES ==========
+
+outputs_cache = OutputsCache()
+
+
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def workspace_dir(request_id):
+    """Isolated Terraform working directory for one approved request."""
+    if not REQUEST_ID_RE.match(request_id):
+        raise HTTPException(status_code=400, detail="request_id may only contain letters, digits, '-' and '_'")
+    return os.path.join(WORKSPACES_DIR, request_id)
+
+
+def prepare_workspace(request_id):
+    """Render the template into the request's workspace and return its path.
+
+    Files are only rewritten when they differ, so an unchanged workspace
+    keeps its memoized `terraform init`.
+    """
+    path = workspace_dir(request_id)
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(TEMPLATE_DIR):
+        if not name.endswith(".tf") and name != ".terraform.lock.hcl":
+            continue
+        dst = os.path.join(path, name)
+        if name == ".terraform.lock.hcl" and os.path.exists(dst):
+            continue
+        with open(os.path.join(TEMPLATE_DIR, name), "rb") as f:
+            content = f.read()
+        if os.path.exists(dst):
+            with open(dst, "rb") as f:
+                if f.read() == content:
+                    continue
+        with open(dst, "wb") as f:
+            f.write(content)
+
+    # Written once: a warm pool workspace keeps its original request_id after
+    # handout, so re-applying it never renames (and replaces) resources
+    tfvars = os.path.join(path, "terraform.tfvars.json")
+    if not os.path.exists(tfvars):
+        with open(tfvars, "w") as f:
+            json.dump({"request_id": request_id}, f, indent=2)
+    return path
+
+
+async def ensure_network(job):
+    """Apply the shared network stack unless its state already has the outputs workspaces read."""
+    async with dir_lock(NETWORK_DIR):
+        state = outputs_cache.get(NETWORK_DIR)
+        if state and state["outputs"].get("subnet_id"):
+            return
+        job.log.append("Creating the shared network (VPC, subnet, internet gateway, routes)")
+        await terraform_init(job, cwd=NETWORK_DIR)
+        await terraform(job, "apply", "-auto-approve", cwd=NETWORK_DIR)
+
+
+def migrate_legacy_state():
+    """Move state from before per-request workspaces into the default workspace.
+
+    Instances launched when Terraform ran directly in TERRAFORM_DIR stay
+    reachable (and destroyable) as request_id "default".
+    """
+    legacy = os.path.join(TERRAFORM_DIR, "terraform.tfstate")
+    if not os.path.exists(legacy):
+        return
+    path = prepare_workspace(DEFAULT_REQUEST_ID)
+    if os.path.exists(os.path.join(path, "terraform.tfstate")):
+        print(f"[WARN] Legacy state {legacy} not migrated: {path} already has a state file")
+        return
+    for name in ("terraform.tfstate", "terraform.tfstate.backup"):
+        src = os.path.join(TERRAFORM_DIR, name)
+        if os.path.exists(src):
+            shutil.move(src, os.path.join(path, name))
+    print(f"[INFO] Migrated legacy Terraform state into {path}")
+
+
+@app.on_event("startup")
+async def start_state_migration():
+    migrate_legacy_state()
+
+
+app.include_router(workspaces_router(WORKSPACES_DIR, "request_id", outputs_cache))
+
+
+# ========== WARM POOL ==========
+
+class WarmPool:
+    """Instances applied and SSH-ready ahead of demand, handed out on launch.
+
+    Pool instances live in ordinary workspaces named pool-<id>; a handout
+    renames the workspace to the request ID, so destroy works unchanged.
+    """
+
+    def __init__(self, min_size, max_size, idle_ttl):
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.idle_ttl = idle_ttl
+        self.target = min_size
+        self.ready = deque()
+        self.refilling = 0
+        self.failure_streak = 0
+        self.retry_at = 0.0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "refills": 0,
+            "refill_failures": 0,
+            "evictions": 0,
+            "refill_seconds_total": 0.0,
+            "last_refill_seconds": None,
+        }
+        self._wake = asyncio.Event()
+        self.task = None
+
+    @property
+    def enabled(self):
+        return self.min_size > 0
+
+    async def acquire(self, request_id):
+        """Move a ready instance into request_id's workspace; returns its IP, or None on a miss."""
+        while self.ready:
+            entry = self.ready.popleft()
+            if not await ssh_port_open(entry["ip"], timeout=2.0):
+                print(f"[WARN] Warm pool instance {entry['id']} ({entry['ip']}) is unreachable, evicting")
+                self._evict(entry)
+                continue
+            src = workspace_dir(entry["id"])
+            try:
+                async with dir_lock(src):
+                    os.rename(src, workspace_dir(request_id))
+            except OSError as e:
+                # request_id got a workspace meanwhile (e.g. a double-click
+                # launch); keep the instance for the next request
+                print(f"[WARN] Warm pool handout of {entry['id']} to {request_id} failed ({e}), re-queued")
+                self.ready.appendleft(entry)
+                return None
+            forget_dir_lock(src)
+            self.stats["hits"] += 1
+            self._wake.set()
+            return entry["ip"]
 
-        time.sleep(10)
-        ip_out = subprocess.check_output(["terraform", "output", "-raw", "public_ip"], cwd=TERRAFORM_DIR)
-        instance_ip = ip_out.decode().strip()
-        return {"status": "Launched", "public_ip": instance_ip}
-    except subprocess.CalledProcessError as e:
-        return {"error": str(e)}
+        self.stats["misses"] += 1
+        self.target = min(self.max_size, self.target + 1)
+        self._wake.set()
+        return None
+
+    def _evict(self, entry):
+        self.stats["evictions"] += 1
+        start_job("warm_pool_evict", _destroy, entry["id"])
+
+    async def _refill(self, job):
+        pool_id = f"pool-{uuid.uuid4().hex[:12]}"
+        start = time.perf_counter()
+        try:
+            result = await _provision(job, pool_id)
+        except Exception:
+            self.stats["refill_failures"] += 1
+            self.failure_streak += 1
+            backoff = min(WARM_POOL_MAX_BACKOFF_SECONDS, WARM_POOL_CHECK_SECONDS * 2 ** self.failure_streak)
+            self.retry_at = time.time() + backoff
+            print(f"[WARN] Warm pool refill failed {self.failure_streak} time(s) in a row, retrying in {backoff:.0f}s")
+            if os.path.isdir(workspace_dir(pool_id)):
+                start_job("warm_pool_evict", _destroy, pool_id)
+            raise
+        finally:
+            self.refilling -= 1
+
+        elapsed = time.perf_counter() - start
+        self.failure_streak = 0
+        self.stats["refills"] += 1
+        self.stats["refill_seconds_total"] += elapsed
+        self.stats["last_refill_seconds"] = round(elapsed, 3)
+        self.ready.append({"id": pool_id, "ip": result["public_ip"], "ready_at": time.time()})
+        self._wake.set()
+        return {"pool_id": pool_id, "public_ip": result["public_ip"], "refill_seconds": round(elapsed, 3)}
+
+    async def _rediscover(self):
+        """Re-adopt pool workspaces that survived a backend restart."""
+        if not os.path.isdir(WORKSPACES_DIR):
+            return
+        for name in sorted(os.listdir(WORKSPACES_DIR)):
+            state = os.path.join(WORKSPACES_DIR, name, "terraform.tfstate")
+            if not name.startswith("pool-") or not os.path.exists(state):
+                continue
+            entry = {"id": name, "ip": None, "ready_at": os.path.getmtime(state)}
+            entry["ip"] = await _public_ip(workspace_dir(name))
+            if entry["ip"]:
+                self.ready.append(entry)
+            else:
+                self._evict(entry)
+
+    async def run(self):
+        await self._rediscover()
+        while True:
+            now = time.time()
+            for entry in sorted(self.ready, key=lambda e: e["ready_at"]):
+                if now - entry["ready_at"] > self.idle_ttl and len(self.ready) > self.min_size:
+                    self.ready.remove(entry)
+                    self.target = max(self.min_size, self.target - 1)
+                    self._evict(entry)
+
+            while len(self.ready) + self.refilling < self.target and now >= self.retry_at:
+                self.refilling += 1
+                start_job("warm_pool_refill", self._refill)
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), WARM_POOL_CHECK_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def to_dict(self):
+        refills = self.stats["refills"]
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "target": self.target,
+            "idle_ttl": self.idle_ttl,
+            "ready": [
+                {"id": e["id"], "public_ip": e["ip"], "idle_seconds": round(time.time() - e["ready_at"], 1)}
+                for e in self.ready
+            ],
+            "refilling": self.refilling,
+            "retry_in": round(max(0.0, self.retry_at - time.time()), 1),
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else None,
+            "avg_refill_seconds": round(self.stats["refill_seconds_total"] / refills, 3) if refills else None,
+        }
+
+
+warm_pool = WarmPool(WARM_POOL_MIN, WARM_POOL_MAX, WARM_POOL_IDLE_TTL)
+
+
+@app.on_event("startup")
+async def start_warm_pool():
+    if warm_pool.enabled:
+        warm_pool.task = asyncio.create_task(warm_pool.run())
+        print(f"[INFO] Warm pool enabled (min={warm_pool.min_size}, max={warm_pool.max_size})")
+
+
+@app.get("/pool/")
+async def pool_status():
+    """Warm pool sizes, hit/miss counts and refill latency."""
+    return warm_pool.to_dict()
+
+
+# ========== EC2 MANAGEMENT ==========
+
+async def _launch(job, request_id):
+    if warm_pool.enabled and not os.path.isdir(workspace_dir(request_id)):
+        ip = await warm_pool.acquire(request_id)
+        if ip:
+            job.log.append(f"Handed out a warm pool instance ({ip})")
+            job.timings["time_to_ready"] = round(time.time() - job.started_at, 3)
+            return {"status": "Launched", "request_id": request_id, "public_ip": ip, "warm_pool": True}
+        job.log.append("Warm pool empty, provisioning a new instance")
+    return await _provision(job, request_id)
+
+
+async def _provision(job, request_id):
+    await ensure_network(job)
+    path = prepare_workspace(request_id)
+    async with dir_lock(path):
+        await terraform_init(job, cwd=path)
+        await terraform(job, "apply", "-auto-approve", cwd=path)
+        ip = await wait_for_instance(job, path)
+    return {"status": "Launched", "request_id": request_id, "public_ip": ip}
+
+
+async def _destroy(job, request_id):
+    path = workspace_dir(request_id)
+    async with dir_lock(path):
+        # The workspace only holds this request's resources, so destroy all of it
+        await terraform_init(job, cwd=path)
+        await terraform(job, "destroy", "-auto-approve", cwd=path)
+        shutil.rmtree(path, ignore_errors=True)
+    forget_dir_lock(path)
+    return {"status": "EC2 instance destroyed successfully", "request_id": request_id}
+
+
+@app.post("/launch_ec2/")
+async def launch_ec2(request_id: str = DEFAULT_REQUEST_ID):
+    """Queue an EC2 launch via Terraform; poll /jobs/{job_id} for the public IP."""
+    workspace_dir(request_id)
+    job = start_job("launch_ec2", _launch, request_id)
+    return {"status": job.status, "job_id": job.id}
 
 @app.get("/get_ip/")
-async def get_ip():
+async def get_ip(request_id: str = DEFAULT_REQUEST_ID):
     """Fetch current Terraform public IP."""
-    try:
-        ip_out = subprocess.check_output(["terraform", "output", "-raw", "public_ip"], cwd=TERRAFORM_DIR)
-        instance_ip = ip_out.decode().strip()
-        return {"public_ip": instance_ip}
-    except Exception:
-        return {"public_ip": None}
+    return {"public_ip": await _public_ip(workspace_dir(request_id))}
 
 @app.post("/destroy_ec2/")
-async def destroy_ec2():
-    """Destroy only EC2 instance, preserving other resources."""
-    try:
-        result = subprocess.run(
-            [
-                "terraform", "destroy",
-                "-target=aws_instance.krish-crp",   # ✅ EC2-specific target
-                "-auto-approve",
+async def destroy_ec2(request_id: str = DEFAULT_REQUEST_ID):
+    """Queue destroy of the EC2 instance and network created for this request."""
+    if not os.path.isdir(workspace_dir(request_id)):
+        raise HTTPException(status_code=404, detail=f"No workspace for request '{request_id}'")
+    job = start_job("destroy_ec2", _destroy, request_id)
+    return {"status": job.status, "job_id": job.id}
+
+
+# ========== SSH CONNECTION POOL ==========
+
+class SSHPool:
+    """Shared asyncssh connections per (ip, user); each terminal opens a channel on one.
+
+    A connection carries at most max_channels sessions (sshd's MaxSessions
+    defaults to 10) and is closed once it has been unused for idle_ttl. If the
+    server refuses a channel below that limit, the connection keeps its open
+    channels but takes no new ones.
+    """
+
+    def __init__(self, idle_ttl, max_channels):
+        self.idle_ttl = idle_ttl
+        self.max_channels = max_channels
+        self._pool = {}
+        self._locks = {}
+        self.stats = {
+            "handshakes": 0,
+            "reuses": 0,
+            "failures": 0,
+            "channel_refusals": 0,
+            "evictions": 0,
+            "connect_seconds_total": 0.0,
+            "last_connect_seconds": None,
+        }
+        self.task = None
+
+    async def acquire(self, ip, user=SSH_USER):
+        """A connection to ip with one channel reserved; pair with release()."""
+        key = (ip, user)
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            for entry in self._pool.get(key, []):
+                if entry["channels"] < entry["limit"]:
+                    entry["channels"] += 1
+                    self.stats["reuses"] += 1
+                    return entry["conn"]
+
+            start = time.perf_counter()
+            try:
+                conn = await asyncssh.connect(
+                    ip,
+                    username=user,
+                    client_keys=[PEM_KEY_PATH],
+                    known_hosts=None,
+                    keepalive_interval=SSH_KEEPALIVE_SECONDS,
+                    keepalive_count_max=3,
+                )
+            except Exception:
+                self.stats["failures"] += 1
+                raise
+            elapsed = time.perf_counter() - start
+            self.stats["handshakes"] += 1
+            self.stats["connect_seconds_total"] += elapsed
+            self.stats["last_connect_seconds"] = round(elapsed, 3)
+
+            entry = {
+                "conn": conn, "key": key, "channels": 1, "limit": self.max_channels, "last_used": time.monotonic(),
+            }
+            self._pool.setdefault(key, []).append(entry)
+            asyncio.create_task(self._watch(entry))
+            return conn
+
+    def release(self, conn, broken=False, refused=False):
+        """Give back a channel slot.
+
+        broken: the connection itself failed, so it is closed and dropped.
+        refused: the server would not open another channel on it; other
+        sessions on the connection are unaffected, it just takes no new ones.
+        """
+        for entries in self._pool.values():
+            for entry in entries:
+                if entry["conn"] is conn:
+                    entry["channels"] -= 1
+                    entry["last_used"] = time.monotonic()
+                    if refused:
+                        self.stats["channel_refusals"] += 1
+                        entry["limit"] = entry["channels"]
+                    if broken:
+                        self._drop(entry)
+                        conn.close()
+                    return
+
+    def _drop(self, entry):
+        entries = self._pool.get(entry["key"], [])
+        if entry in entries:
+            entries.remove(entry)
+        if not entries:
+            self._pool.pop(entry["key"], None)
+
+    async def _watch(self, entry):
+        await entry["conn"].wait_closed()
+        self._drop(entry)
+
+    async def reap(self):
+        """Close connections that have had no open channels for idle_ttl seconds."""
+        while True:
+            await asyncio.sleep(min(self.idle_ttl, 30))
+            now = time.monotonic()
+            for entries in list(self._pool.values()):
+                for entry in list(entries):
+                    if entry["channels"] <= 0 and now - entry["last_used"] > self.idle_ttl:
+                        self.stats["evictions"] += 1
+                        self._drop(entry)
+                        entry["conn"].close()
+
+    def to_dict(self):
+        handshakes = self.stats["handshakes"]
+        now = time.monotonic()
+        return {
+            **self.stats,
+            "avg_connect_seconds": (
+                round(self.stats["connect_seconds_total"] / handshakes, 3) if handshakes else None
+            ),
+            "connections": [
+                {
+                    "ip": entry["key"][0],
+                    "user": entry["key"][1],
+                    "channels": entry["channels"],
+                    "channel_limit": entry["limit"],
+                    "idle_seconds": round(now - entry["last_used"], 1) if entry["channels"] <= 0 else 0,
+                }
+                for entries in self._pool.values()
+                for entry in entries
             ],
-            cwd=TERRAFORM_DIR,
-            capture_output=True,
-            text=True,
-            check=True,
-        )
+        }
+
+
+ssh_pool = SSHPool(SSH_IDLE_TTL, SSH_MAX_CHANNELS)
+
+
+@app.on_event("startup")
+async def start_ssh_reaper():
+    ssh_pool.task = asyncio.create_task(ssh_pool.reap())
+
+
+@app.get("/ssh/stats")
+async def ssh_stats():
+    """Handshake vs. reuse counts, connect latency and open pooled connections."""
+    return ssh_pool.to_dict()
+
+
+async def open_terminal(ip):
+    """Start `bash --login` in a PTY on a pooled connection; returns (conn, proc).
+
+    A failed channel open is retried once on another connection. A refused
+    channel (e.g. sshd's MaxSessions) leaves the connection and its other
+    sessions alone; only a connection that failed as a whole is closed.
+    """
+    for attempt in (1, 2):
+        conn = await ssh_pool.acquire(ip)
+        try:
+            proc = await conn.create_process(
+                "bash --login",
+                term_type="xterm-256color",
+                term_size=(120, 40),
+                encoding=None,
+            )
+            return conn, proc
+        except asyncssh.ChannelOpenError:
+            ssh_pool.release(conn, refused=True)
+            if attempt == 2:
+                raise
+        except (asyncssh.Error, OSError):
+            ssh_pool.release(conn, broken=True)
+            if attempt == 2:
+                raise
+
+
+# ========== FLEET EXEC ==========
+
+class FleetExecRequest(BaseModel):
+    command: str
+    hosts: List[str] = []
+    request_ids: List[str] = []
+    user: str = SSH_USER
+    timeout: float = FLEET_HOST_TIMEOUT
+    concurrency: int = FLEET_CONCURRENCY
+
+
+def _truncate(text):
+    if text and len(text) > FLEET_MAX_OUTPUT_CHARS:
+        return text[:FLEET_MAX_OUTPUT_CHARS] + f"\n[... truncated {len(text) - FLEET_MAX_OUTPUT_CHARS} chars]"
+    return text
+
+
+async def _exec_on_host(host, req, semaphore):
+    """Run req.command on one host over a pooled connection; never raises."""
+    async with semaphore:
+        start = time.perf_counter()
+        deadline = time.monotonic() + req.timeout
+        conn = None
+        try:
+            conn = await asyncio.wait_for(ssh_pool.acquire(host, req.user), req.timeout)
+            result = await conn.run(
+                req.command, check=False, timeout=max(0.1, deadline - time.monotonic()),
+            )
+            return {
+                "host": host,
+                "exit_status": result.exit_status,
+                "stdout": _truncate(result.stdout),
+                "stderr": _truncate(result.stderr),
+                "duration": round(time.perf_counter() - start, 3),
+            }
+        except asyncio.TimeoutError:
+            error = f"Timed out after {req.timeout:.0f}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finally:
+            if conn is not None:
+                ssh_pool.release(conn)
+        return {"host": host, "error": error, "duration": round(time.perf_counter() - start, 3)}
+
+
+@app.post("/fleet/exec")
+async def fleet_exec(req: FleetExecRequest):
+    """Run one command on many instances at once, streaming NDJSON results as hosts finish.
+
+    Hosts come from `hosts` and/or the public IPs of `request_ids`. At most
+    `concurrency` hosts run at a time, each bounded by `timeout` seconds.
+    The last line is a summary.
+    """
+    hosts = list(dict.fromkeys(req.hosts))
+    for request_id in req.request_ids:
+        ip = await _public_ip(workspace_dir(request_id))
+        if not ip:
+            raise HTTPException(status_code=404, detail=f"No running instance for request '{request_id}'")
+        if ip not in hosts:
+            hosts.append(ip)
+    if not hosts:
+        raise HTTPException(status_code=400, detail="No hosts given")
+
+    semaphore = asyncio.Semaphore(max(1, min(req.concurrency, FLEET_MAX_CONCURRENCY)))
+    start = time.perf_counter()
+
+    async def results():
+        tasks = [asyncio.create_task(_exec_on_host(host, req, semaphore)) for host in hosts]
+        succeeded = failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result.get("exit_status") == 0:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield json.dumps(result) + "\n"
+            summary = {
+                "hosts": len(hosts),
+                "succeeded": succeeded,
+                "failed": failed,
+                "duration": round(time.perf_counter() - start, 3),
+            }
+            yield json.dumps({"summary": summary}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+# ========== SSH TERMINAL ==========
+
+class TerminalMetrics:
+    """Keystroke echo latency and output throughput across all terminals."""
+
+    def __init__(self, samples=1000):
+        self.echo_latencies = deque(maxlen=samples)
+        self.bytes_out = 0
+        self.frames_out = 0
+        self.bytes_in = 0
+        self.busy_seconds = 0.0
+
+    def to_dict(self):
+        latencies = sorted(self.echo_latencies)
+
+        def pct(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2)
 
         return {
-            "status": "EC2 instance destroyed successfully",
-            "details": result.stdout,
+            "bytes_out": self.bytes_out,
+            "frames_out": self.frames_out,
+            "bytes_in": self.bytes_in,
+            "avg_frame_bytes": round(self.bytes_out / self.frames_out) if self.frames_out else None,
+            "throughput_bytes_per_sec": round(self.bytes_out / self.busy_seconds) if self.busy_seconds else None,
+            "echo_latency_ms": {
+                "samples": len(latencies),
+                "p50": pct(0.5),
+                "p95": pct(0.95),
+                "max": round(latencies[-1] * 1000, 2),
+            } if latencies else None,
         }
 
-    except subprocess.CalledProcessError as e:
+
+terminal_metrics = TerminalMetrics()
+
+
+@app.get("/terminal/stats")
+async def terminal_stats():
+    """Echo latency percentiles and output throughput of the terminal I/O path."""
+    return terminal_metrics.to_dict()
+
+
+class TerminalSession:
+    """A remote shell that outlives its WebSocket, with bounded server-side scrollback.
+
+    The reader always drains the PTY into the scrollback ring. While a
+    WebSocket is attached, output also goes through a bounded queue to
+    stream(): everything already queued is sent as one binary frame, and
+    during bursts TERM_COALESCE_SECONDS is spent gathering more, while a
+    lone keystroke echo goes out at once. A slow browser blocks the send,
+    the queue fills and the reader stops, which closes the SSH channel
+    window and throttles the remote side. Detached sessions keep reading;
+    SESSION_SCROLLBACK_BYTES bounds their memory.
+    """
+
+    def __init__(self, ip, conn, proc, metrics=terminal_metrics):
+        self.id = uuid.uuid4().hex
+        self.ip = ip
+        self.conn = conn
+        self.proc = proc
+        self.metrics = metrics
+        self.scrollback = deque()
+        self.scrollback_bytes = 0
+        self.queue = asyncio.Queue(maxsize=TERM_QUEUE_CHUNKS)
+        self.websocket = None
+        self.created_at = time.time()
+        self.detached_at = time.monotonic()
+        self.ended = False
+        self.closed = False
+        self.pending_input_at = None
+        self.reader = asyncio.create_task(self._read())
+
+    def write(self, data):
+        """Forward input to the PTY and start timing its echo."""
+        self.proc.stdin.write(data)
+        self.metrics.bytes_in += len(data)
+        if self.pending_input_at is None:
+            self.pending_input_at = time.perf_counter()
+
+    def _remember(self, data):
+        self.scrollback.append(data)
+        self.scrollback_bytes += len(data)
+        while self.scrollback_bytes > SESSION_SCROLLBACK_BYTES and len(self.scrollback) > 1:
+            self.scrollback_bytes -= len(self.scrollback.popleft())
+
+    async def _read(self):
+        try:
+            while True:
+                data = await self.proc.stdout.read(TERM_READ_BYTES)
+                if not data:
+                    break
+                if self.pending_input_at is not None:
+                    self.metrics.echo_latencies.append(time.perf_counter() - self.pending_input_at)
+                    self.pending_input_at = None
+                self._remember(data)
+                if self.websocket is not None:
+                    await self.queue.put(data)
+        except (asyncssh.Error, OSError) as e:
+            print(f"[Reader stopped] {e}")
+        self.ended = True
+        if self.websocket is not None:
+            await self.queue.put(None)
+        else:
+            close_session(self)
+
+    def _clear_queue(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def attach(self, websocket):
+        """Bind websocket to this session and return the scrollback to replay to it."""
+        self._clear_queue()
+        self.websocket = websocket
+        self.detached_at = None
+        return b"".join(self.scrollback)
+
+    def detach(self, websocket):
+        if self.websocket is websocket:
+            self.websocket = None
+            self.detached_at = time.monotonic()
+            self._clear_queue()
+            if self.ended:
+                # The shell exited while attached; nothing left to reattach to
+                close_session(self)
+
+    def _drain(self, frame):
+        while len(frame) < TERM_FRAME_BYTES and not self.queue.empty():
+            chunk = self.queue.get_nowait()
+            if chunk is None:
+                return False
+            frame += chunk
+        return True
+
+    async def stream(self, websocket):
+        """Send live output to websocket as coalesced binary frames until EOF or detach."""
+        while self.websocket is websocket:
+            chunk = await self.queue.get()
+            alive = chunk is not None
+            if alive:
+                start = time.perf_counter()
+                frame = bytearray(chunk)
+                alive = self._drain(frame)
+                if alive and len(frame) >= TERM_READ_BYTES:
+                    await asyncio.sleep(TERM_COALESCE_SECONDS)
+                    alive = self._drain(frame)
+                await websocket.send_bytes(bytes(frame))
+                self.metrics.bytes_out += len(frame)
+                self.metrics.frames_out += 1
+                self.metrics.busy_seconds += time.perf_counter() - start
+            if not alive:
+                # The remote shell exited: end the WebSocket so the receive loop stops too
+                await websocket.send_text(json.dumps({"type": "ended"}))
+                await websocket.close()
+                return
+
+    def to_dict(self):
         return {
-            "error": e.stderr or str(e),
-            "message": "Terraform EC2 destroy failed"
+            "session_id": self.id,
+            "ip": self.ip,
+            "attached": self.websocket is not None,
+            "detached_seconds": (
+                round(time.monotonic() - self.detached_at, 1) if self.detached_at is not None else None
+            ),
+            "scrollback_bytes": self.scrollback_bytes,
+            "created_at": self.created_at,
         }
 
-# ========== SSH TERMINAL ==========
+
+sessions = {}
+
+
+def close_session(session):
+    """End the shell, free its channel on the pooled connection and forget it."""
+    if session.closed:
+        return
+    session.closed = True
+    sessions.pop(session.id, None)
+    if session.reader is not asyncio.current_task():
+        session.reader.cancel()
+    session.proc.close()
+    ssh_pool.release(session.conn)
+
+
+async def new_session(ip):
+    """Open a terminal session, evicting the longest-detached one when at SESSION_MAX."""
+    if len(sessions) >= SESSION_MAX:
+        detached = [s for s in sessions.values() if s.websocket is None]
+        if not detached:
+            raise RuntimeError(f"Too many terminal sessions open (max {SESSION_MAX})")
+        close_session(min(detached, key=lambda s: s.detached_at))
+    conn, proc = await open_terminal(ip)
+    session = TerminalSession(ip, conn, proc)
+    sessions[session.id] = session
+    return session
+
+
+async def reap_sessions():
+    """Close sessions that stayed detached longer than the grace period."""
+    while True:
+        await asyncio.sleep(5)
+        now = time.monotonic()
+        for session in list(sessions.values()):
+            if session.detached_at is not None and now - session.detached_at > SESSION_GRACE_SECONDS:
+                print(f"[INFO] Terminal session {session.id} ({session.ip}) expired after grace period")
+                close_session(session)
+
+
+@app.on_event("startup")
+async def start_session_reaper():
+    asyncio.create_task(reap_sessions())
+
+
+@app.get("/sessions/")
+async def list_sessions():
+    """Open terminal sessions, attached or waiting to be reattached."""
+    return {"sessions": [s.to_dict() for s in sessions.values()]}
+
+
+@app.delete("/sessions/{session_id}")
+async def kill_session(session_id: str):
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    close_session(session)
+    return {"status": "Session closed", "session_id": session_id}
+
 
 @app.websocket("/ws/ssh")
-async def websocket_ssh(websocket: WebSocket, ip: str):
-    """Fully interactive SSH terminal."""
+async def websocket_ssh(websocket: WebSocket, ip: str, session_id: Optional[str] = None):
+    """Fully interactive SSH terminal; reconnecting with session_id replays its scrollback."""
     await websocket.accept()
     print(f"[INFO] WebSocket connected for EC2: {ip}")
 
+    session = stream_task = None
     try:
-        async with asyncssh.connect(
-            ip,
-            username=SSH_USER,
-            client_keys=[PEM_KEY_PATH],
-            known_hosts=None,
-        ) as conn:
-            proc = await conn.create_process(
-                "bash --login",
-                term_type="xterm-256color",
-                term_size=(120, 40),
-            )
+        session = sessions.get(session_id) if session_id else None
+        if session is not None and (session.ip != ip or session.ended):
+            session = None
+
+        if session is None:
+            session = await new_session(ip)
+            await websocket.send_text(json.dumps({"type": "session", "session_id": session.id}))
             await websocket.send_text(f"Connected to {ip}\r\n")
+        else:
+            await websocket.send_text(
+                json.dumps({"type": "session", "session_id": session.id, "reattached": True})
+            )
 
-            async def reader():
-                try:
-                    while True:
-                        data = await proc.stdout.read(4096)
-                        if not data:
-                            await asyncio.sleep(0.05)
-                            continue
-                        await websocket.send_text(data)
-                except Exception as e:
-                    print(f"[Reader stopped] {e}")
+        previous = session.websocket
+        replay = session.attach(websocket)
+        if previous is not None:
+            # Another tab had this session; it is taken over by this one
+            try:
+                await previous.close()
+            except Exception:
+                pass
+        for offset in range(0, len(replay), TERM_FRAME_BYTES):
+            await websocket.send_bytes(replay[offset:offset + TERM_FRAME_BYTES])
 
-            reader_task = asyncio.create_task(reader())
+        stream_task = asyncio.create_task(session.stream(websocket))
 
-            while True:
-                try:
-                    data = await websocket.receive_text()
-                    if data.lower().strip() in ["exit", "logout"]:
-                        proc.stdin.write("exit\n")
-                        await websocket.send_text("\r\n[INFO] Session closed by user.\r\n")
-                        break
-                    proc.stdin.write(data)
-                except WebSocketDisconnect:
+        while True:
+            try:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
                     print("[INFO] WebSocket disconnected.")
                     break
-                except Exception as e:
-                    print("[ERROR write]", e)
+                text = message.get("text")
+                if text is not None and text.lower().strip() in ["exit", "logout"]:
+                    session.write(b"exit\n")
+                    await websocket.send_text("\r\n[INFO] Session closed by user.\r\n")
+                    await websocket.send_text(json.dumps({"type": "ended"}))
                     break
-
-            reader_task.cancel()
+                data = text.encode() if text is not None else message.get("bytes")
+                if data:
+                    session.write(data)
+            except Exception as e:
+                print("[ERROR write]", e)
+                break
 
     except Exception as e:
         print("[ERROR]", e)
@@ -139,6 +981,11 @@ async def websocket_ssh(websocket: WebSocket, ip: str):
         except Exception:
             pass
     finally:
+        # The shell keeps running for SESSION_GRACE_SECONDS so the browser can reattach
+        if stream_task is not None:
+            stream_task.cancel()
+        if session is not None:
+            session.detach(websocket)
         try:
             await websocket.close()
         except Exception:
@@ -1,29 +1,43 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import requests
+import os
+import sys
+
+# Job streaming helper shared with the S3 dashboard (common/ at the repo root)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.dashboard_jobs import follow_job
 
 st.set_page_config(page_title="💻 EC2 Live SSH Terminal", layout="wide")
 
 st.title("💻 EC2 Live SSH Terminal")
 BASE_URL = "http://127.0.0.1:8002"
 
+# The main dashboard links here with ?request_id=<approved request>
+REQUEST_ID = st.query_params.get("request_id", "default")
+st.caption(f"Request: {REQUEST_ID}")
+
 # ====== Control Buttons ======
 col1, col2, col3 = st.columns(3)
 
 with col1:
     if st.button("🚀 Create Instance"):
         st.info("Launching EC2 instance... Please wait ⏳")
-        res = requests.post(f"{BASE_URL}/launch_ec2/")
+        res = requests.post(f"{BASE_URL}/launch_ec2/", params={"request_id": REQUEST_ID})
         if res.status_code == 200:
-            data = res.json()
-            st.success(f"✅ Instance launched! Public IP: {data.get('public_ip', 'N/A')}")
-            st.session_state["ip"] = data.get("public_ip", "")
+            job = follow_job(BASE_URL, res.json()["job_id"])
+            if job["status"] == "succeeded":
+                data = job["result"]
+                st.success(f"✅ Instance launched! Public IP: {data.get('public_ip', 'N/A')}")
+                st.session_state["ip"] = data.get("public_ip", "")
+            else:
+                st.error(f"Failed to launch EC2 instance\n\n{job['error']}")
         else:
             st.error("Failed to launch EC2 instance")
 
 with col2:
     if st.button("🌐 View Public IP"):
-        res = requests.get(f"{BASE_URL}/get_ip/")
+        res = requests.get(f"{BASE_URL}/get_ip/", params={"request_id": REQUEST_ID})
         if res.status_code == 200:
             ip = res.json().get("public_ip")
             if ip:
@@ -36,10 +50,14 @@ with col2:
 
 with col3:
     if st.button("🗑 Destroy Instance"):
-        res = requests.post(f"{BASE_URL}/destroy_ec2/")
+        res = requests.post(f"{BASE_URL}/destroy_ec2/", params={"request_id": REQUEST_ID})
         if res.status_code == 200:
-            st.warning("Instance destroyed successfully 🧹")
-            st.session_state["ip"] = ""
+            job = follow_job(BASE_URL, res.json()["job_id"])
+            if job["status"] == "succeeded":
+                st.warning("Instance destroyed successfully 🧹")
+                st.session_state["ip"] = ""
+            else:
+                st.error(f"Failed to destroy instance\n\n{job['error']}")
         else:
             st.error("Failed to destroy instance")
 
@@ -101,13 +119,39 @@ if ip.strip():
         term.focus();
         termDiv.addEventListener('click', () => term.focus());
         term.write('Connecting to {ip}...\\r\\n');
-        const socket = new WebSocket('ws://127.0.0.1:8002/ws/ssh?ip={ip}');
+        // Reattach to this IP's previous session (if still alive) after a reload
+        const sessionKey = 'ec2-terminal-session-{ip}';
+        const storage = {{
+          get: () => {{ try {{ return window.localStorage.getItem(sessionKey); }} catch (e) {{ return null; }} }},
+          set: (id) => {{ try {{ window.localStorage.setItem(sessionKey, id); }} catch (e) {{}} }},
+          clear: () => {{ try {{ window.localStorage.removeItem(sessionKey); }} catch (e) {{}} }},
+        }};
+        const savedSession = storage.get();
+        const socket = new WebSocket(
+          'ws://127.0.0.1:8002/ws/ssh?ip={ip}' + (savedSession ? '&session_id=' + savedSession : '')
+        );
+        socket.binaryType = 'arraybuffer';
         socket.onopen = () => {{
           term.write('[Connected to EC2: {ip}]\\r\\n');
           term.focus();
         }};
         socket.onmessage = (event) => {{
-          term.write(event.data);
+          // Terminal output arrives as binary frames; text frames are status
+          // messages or JSON control messages about the session
+          if (typeof event.data === 'string' && event.data.startsWith('{{"type"')) {{
+            const msg = JSON.parse(event.data);
+            if (msg.type === 'session') {{
+              storage.set(msg.session_id);
+              if (msg.reattached) {{
+                term.write('[Reattached to running session]\\r\\n');
+              }}
+            }} else if (msg.type === 'ended') {{
+              storage.clear();
+              term.write('\\r\\n[Session ended]\\r\\n');
+            }}
+            return;
+          }}
+          term.write(typeof event.data === 'string' ? event.data : new Uint8Array(event.data));
         }};
         socket.onclose = () => {{
           term.write('\\r\\n[Connection closed]\\r\\n');
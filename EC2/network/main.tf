@@ -0,0 +1,69 @@
+# Network shared by every EC2 request workspace, applied once by the backend.
+# Per-request workspaces only add a security group and an instance, so the
+# per-region VPC and internet gateway quotas do not cap parallel requests.
+
+provider "aws" {
+  region     = "us-east-1"
+  access_key = "your-access-key"  
+  secret_key = "your-secret-key"
+}
+
+resource "aws_vpc" "vpc-1" {
+  cidr_block       = "10.0.0.0/16"
+  instance_tenancy = "default"
+
+  tags = {
+    Name = "terraform-test-vpc"
+  }
+}
+
+resource "aws_internet_gateway" "gw" {
+  vpc_id = aws_vpc.vpc-1.id
+
+  tags = {
+    Name = "terraform-test-gateway"
+  }
+}
+
+
+resource "aws_route_table" "test-routetable" {
+  vpc_id = aws_vpc.vpc-1.id
+
+  route {
+    cidr_block = "0.0.0.0/0"
+    gateway_id = aws_internet_gateway.gw.id
+  }
+
+  route {
+    ipv6_cidr_block        = "::/0"
+    gateway_id = aws_internet_gateway.gw.id
+  }
+
+  tags = {
+    Name = "terraform-test-routetable"
+  }
+}
+
+resource "aws_subnet" "subnet-1" {
+  vpc_id     = aws_vpc.vpc-1.id
+  cidr_block = "10.0.1.0/24"
+  availability_zone = "us-east-1a"  # ✅ Add this
+
+  tags = {
+    Name = "terraform-test-subnet"
+  }
+}
+
+resource "aws_route_table_association" "a" {
+  subnet_id      = aws_subnet.subnet-1.id
+  route_table_id = aws_route_table.test-routetable.id
+}
+
+
+output "vpc_id" {
+  value = aws_vpc.vpc-1.id
+}
+
+output "subnet_id" {
+  value = aws_subnet.subnet-1.id
+}
@@ -1,66 +1,32 @@
+variable "request_id" {
+  description = "Approved request this workspace was generated for"
+  type        = string
+}
+
 provider "aws" {
   region     = "us-east-1"
   access_key = "your-access-key"  
   secret_key = "your-secret-key"
 }
 
-resource "aws_vpc" "vpc-1" {
-  cidr_block       = "10.0.0.0/16"
-  instance_tenancy = "default"
-
-  tags = {
-    Name = "terraform-test-vpc"
+# VPC, subnet, gateway and routes come from the shared stack in EC2/network,
+# applied by the backend before any request workspace
+data "terraform_remote_state" "network" {
+  backend = "local"
+  config = {
+    path = "${path.module}/../../network/terraform.tfstate"
   }
-}
-
-resource "aws_internet_gateway" "gw" {
-  vpc_id = aws_vpc.vpc-1.id
-
-  tags = {
-    Name = "terraform-test-gateway"
+  # Lets destroy plan even if the shared stack was never applied here
+  defaults = {
+    vpc_id    = null
+    subnet_id = null
   }
 }
 
-
-resource "aws_route_table" "test-routetable" {
-  vpc_id = aws_vpc.vpc-1.id
-
-  route {
-    cidr_block = "0.0.0.0/0"
-    gateway_id = aws_internet_gateway.gw.id
-  }
-
-  route {
-    ipv6_cidr_block        = "::/0"
-    gateway_id = aws_internet_gateway.gw.id
-  }
-
-  tags = {
-    Name = "terraform-test-gateway"
-  }
-}
-
-resource "aws_subnet" "subnet-1" {
-  vpc_id     = aws_vpc.vpc-1.id
-  cidr_block = "10.0.1.0/24"
-  availability_zone = "us-east-1a"  # ✅ Add this
-
-  tags = {
-    Name = "terraform-test-subnet"
-  }
-}
-
-resource "aws_route_table_association" "a" {
-  subnet_id      = aws_subnet.subnet-1.id
-  route_table_id = aws_route_table.test-routetable.id
-}
-
-
-
 resource "aws_security_group" "allow_tls" {
-  name        = "allow_tls"
+  name        = "allow_tls-${var.request_id}"
   description = "Allow TLS inbound traffic and all outbound traffic"
-  vpc_id      = aws_vpc.vpc-1.id
+  vpc_id      = data.terraform_remote_state.network.outputs.vpc_id
 
   tags = {
     Name = "allow_tls"
@@ -98,16 +64,10 @@ resource "aws_vpc_security_group_egress_rule" "allow_all_traffic_ipv4" {
 }
 
 
-resource "aws_network_interface" "test-network" {
-  subnet_id       = aws_subnet.subnet-1.id
-  private_ips     = ["10.0.1.50"]
-  security_groups = [aws_security_group.allow_tls.id]
-}
-
 resource "aws_instance" "krish-crp" {
   ami                    = "ami-0360c520857e3138f" # Ubuntu 20.04 LTS (example for us-east-1)
   instance_type          = "t3.micro"
-  subnet_id              = aws_subnet.subnet-1.id
+  subnet_id              = data.terraform_remote_state.network.outputs.subnet_id
   vpc_security_group_ids = [aws_security_group.allow_tls.id]
   key_name               = "krish-crp"
   
@@ -115,7 +75,8 @@ resource "aws_instance" "krish-crp" {
   
 
    tags = {
-     Name = "krish-crp"
+     Name      = "krish-crp-${var.request_id}"
+     RequestId = var.request_id
 
    }
 }
@@ -130,5 +91,5 @@ output "public_ip" {
 # 1. CREATE A KEY PAIR
 
 # AUTOMATED WORKS
-# 1. VPC, INTERNET GATEWAY, SUBNET, ROUTE TABLE
+# 1. VPC, INTERNET GATEWAY, SUBNET, ROUTE TABLE (shared, EC2/network)
 # 2. SECURITY GROUPS TO ALLOW SSH 22, HTTP 80, HTTPS 443
@@ -1,18 +1,55 @@
 
-from fastapi import FastAPI, UploadFile, Form, Query
+from fastapi import FastAPI, UploadFile, Form, Query, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 from dotenv import load_dotenv
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import asyncio
+import hashlib
+import json
+import threading
 import os
+import posixpath
+import re
+import shutil
+import struct
+import tarfile
+import zlib
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from functools import partial
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import quote
+from datetime import datetime, timezone
+from sqlalchemy import (
+    create_engine, event, Column, String, BigInteger, DateTime, Index, select, delete, func
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker, declarative_base
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip always works
+    zstandard = None
 import mimetypes
+import sys
 import time
 
-app = FastAPI(title="Terraform + S3 Mediator API")
-
+# Before the shared job module, so .env settings reach its config too
 load_dotenv()
 
+# Terraform job runner shared with the EC2 backend (common/ at the repo root)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.terraform_jobs import (
+    OutputsCache, dir_lock, forget_dir_lock, router as jobs_router, start_job, terraform, terraform_init,
+    wait_until, workspaces_router,
+)
+
+app = FastAPI(title="Terraform + S3 Mediator API")
+
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
@@ -25,18 +62,144 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.include_router(jobs_router)
+
+# Upload transfer settings: multipart threshold and part size (MiB), parts
+# uploaded in parallel per file, and uploads running at once
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8"))
+S3_MULTIPART_CHUNKSIZE_MB = int(os.getenv("S3_MULTIPART_CHUNKSIZE_MB", "16"))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "10"))
+S3_TRANSFER_WORKERS = int(os.getenv("S3_TRANSFER_WORKERS", "4"))
+
+# S3 API calls from request handlers (list, head, delete, get...): threads
+# serving them, connections pooled across all S3 traffic, and retry attempts
+# (adaptive mode: exponential backoff with jitter plus client-side rate limiting)
+S3_API_WORKERS = int(os.getenv("S3_API_WORKERS", "32"))
+S3_MAX_POOL_CONNECTIONS = int(os.getenv(
+    "S3_MAX_POOL_CONNECTIONS", str(S3_MAX_CONCURRENCY * S3_TRANSFER_WORKERS + S3_API_WORKERS)
+))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "8"))
+
+# Streaming uploads: part size (MiB, S3 minimum is 5) and parts in flight per
+# upload; each upload holds at most part size * (in-flight parts + 1) in memory
+S3_STREAM_PART_MB = max(5, int(os.getenv("S3_STREAM_PART_MB", "8")))
+S3_STREAM_MAX_INFLIGHT = int(os.getenv("S3_STREAM_MAX_INFLIGHT", "4"))
+
+# Bulk delete: S3 accepts at most 1000 keys per delete_objects call; this many
+# batches are sent at once
+S3_DELETE_BATCH = 1000
+S3_DELETE_CONCURRENCY = int(os.getenv("S3_DELETE_CONCURRENCY", "8"))
+
+# Archive expansion: small entries are buffered and uploaded in parallel on a
+# pool of this many threads (and at most this many buffered per archive);
+# entries above the multipart threshold stream inline
+S3_EXPAND_MAX_INFLIGHT = int(os.getenv("S3_EXPAND_MAX_INFLIGHT", "16"))
+# Archives parsed at once; each holds a parser thread for the whole upload
+S3_EXPAND_MAX_ARCHIVES = int(os.getenv("S3_EXPAND_MAX_ARCHIVES", "4"))
+
+# Bucket usage stats: cached totals are kept current from uploads/deletes and
+# fully rescanned once they are older than this
+S3_STATS_TTL_SECONDS = float(os.getenv("S3_STATS_TTL_SECONDS", "3600"))
+
+# Sync planning: HEAD requests in flight while checking objects the digest
+# index cannot vouch for
+S3_SYNC_HEAD_CONCURRENCY = int(os.getenv("S3_SYNC_HEAD_CONCURRENCY", "32"))
+
+# Transparent compression: default codec for buckets without their own
+# policy ("none", "gzip" or "zstd"), levels, and the content types it applies to
+S3_COMPRESS_DEFAULT = os.getenv("S3_COMPRESS_DEFAULT", "none")
+S3_GZIP_LEVEL = int(os.getenv("S3_GZIP_LEVEL", "6"))
+S3_ZSTD_LEVEL = int(os.getenv("S3_ZSTD_LEVEL", "3"))
+S3_COMPRESS_TYPES = os.getenv(
+    "S3_COMPRESS_TYPES",
+    "text/,application/json,application/x-ndjson,application/xml,application/javascript,"
+    "application/yaml,application/x-yaml,image/svg+xml",
+).split(",")
+
+# Lifetime of presigned URLs handed to clients, and the most parts one
+# presigned multipart upload may request
+PRESIGN_EXPIRES_SECONDS = int(os.getenv("PRESIGN_EXPIRES_SECONDS", "3600"))
+PRESIGN_MAX_PARTS = int(os.getenv("PRESIGN_MAX_PARTS", "10000"))
+
+# Chunk size (KiB) for proxied downloads; memory per download stays at one chunk
+S3_DOWNLOAD_CHUNK_KB = int(os.getenv("S3_DOWNLOAD_CHUNK_KB", "1024"))
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+    multipart_chunksize=S3_MULTIPART_CHUNKSIZE_MB * 1024 * 1024,
+    max_concurrency=S3_MAX_CONCURRENCY,
+    use_threads=True,
+)
 
-# Initialize S3 client
+# Initialize S3 client, with enough pooled connections for every part of
+# every concurrent upload plus every API worker, kept alive between requests
 s3_client = boto3.client(
     "s3",
     region_name=AWS_REGION,
     aws_access_key_id=AWS_ACCESS_KEY_ID,
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+    config=Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={"mode": "adaptive", "max_attempts": S3_MAX_ATTEMPTS},
+        signature_version="s3v4",
+    ),
 )
 
+# Uploads run here, off the event loop, so other requests stay responsive
+transfer_executor = ThreadPoolExecutor(max_workers=S3_TRANSFER_WORKERS, thread_name_prefix="s3-transfer")
+# Small entries of expanded archives, kept apart so they neither wait behind
+# nor hold up regular uploads
+expand_executor = ThreadPoolExecutor(max_workers=S3_EXPAND_MAX_INFLIGHT, thread_name_prefix="s3-expand")
+# Archive parsers, which block for a whole upload; off the loop's default
+# executor so they never hold up the index and digest work of other requests
+archive_executor = ThreadPoolExecutor(max_workers=S3_EXPAND_MAX_ARCHIVES, thread_name_prefix="s3-archive")
+
+
+class AsyncS3:
+    """Awaitable S3 client: `await s3.list_objects_v2(...)` runs the boto3 call on a
+    dedicated pool, so slow S3 calls never hold the event loop or FastAPI's
+    shared threadpool, and never queue behind uploads.
+    """
+
+    def __init__(self, client, executor):
+        self._client = client
+        self._executor = executor
+
+    def run(self, fn, *args, **kwargs):
+        """Run any blocking S3-bound helper on the API pool."""
+        return asyncio.get_running_loop().run_in_executor(self._executor, partial(fn, *args, **kwargs))
 
-# Terraform working directory
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def call(*args, **kwargs):
+            return self.run(method, *args, **kwargs)
+
+        return call
+
+
+s3 = AsyncS3(s3_client, ThreadPoolExecutor(max_workers=S3_API_WORKERS, thread_name_prefix="s3-api"))
+
+
+# Terraform working directory; every bucket gets its own workspace under it
 TF_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKSPACES_DIR = os.path.join(TF_DIR, "workspaces")
+
+# How buckets are provisioned by default: "terraform" (init + apply) or
+# "boto3" (direct API calls, adoptable by Terraform later via import blocks)
+PROVISION_ENGINES = ("terraform", "boto3")
+S3_PROVISION_ENGINE = os.getenv("S3_PROVISION_ENGINE", "terraform")
+
+# Local SQLite index of bucket contents, and how often it is reconciled
+# against S3 with a full paginated scan
+INDEX_DB_PATH = os.getenv("S3_INDEX_DB", os.path.join(TF_DIR, "object_index.db"))
+INDEX_RECONCILE_SECONDS = float(os.getenv("INDEX_RECONCILE_SECONDS", "900"))
+
+# How long a new bucket may take to become visible to head_bucket
+READY_TIMEOUT_SECONDS = float(os.getenv("READY_TIMEOUT_SECONDS", "120"))
+# Readiness polls back off from the first delay to the second (seconds)
+READY_POLL_DELAYS = {"initial_delay": 0.25, "max_delay": 5.0}
 
 
 # -------------------------------------------------
@@ -46,18 +209,320 @@ class BucketModel(BaseModel):
     bucket_name: str
 
 
+class PresignModel(BaseModel):
+    key: str
+    method: str = "get"
+    content_type: Optional[str] = None
+    expires_in: int = PRESIGN_EXPIRES_SECONDS
+    max_size: Optional[int] = None
+    download: bool = False
+
+
+class PresignMultipartModel(BaseModel):
+    key: str
+    parts: int
+    content_type: Optional[str] = None
+    expires_in: int = PRESIGN_EXPIRES_SECONDS
+
+
+class CompleteMultipartModel(BaseModel):
+    key: str
+    upload_id: str
+    parts: List[dict] = []
+
+
+class SyncFileModel(BaseModel):
+    key: str
+    size: int
+    sha256: str
+
+
+class SyncPlanModel(BaseModel):
+    files: List[SyncFileModel]
+    prefix: str = ""
+    delete: bool = False
+
+
 # -------------------------------------------------
-# CREATE BUCKET (via Terraform)
+# OBJECT INDEX (SQLite)
 # -------------------------------------------------
-@app.post("/bucket/create")
-def create_bucket(bucket_name: str = Form(...)):
+# Keys, sizes, ETags and timestamps per bucket, updated inline by uploads and
+# deletes and reconciled periodically, so browsing and search never hit S3.
+engine = create_engine(f"sqlite:///{INDEX_DB_PATH}", connect_args={"check_same_thread": False})
+SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+Base = declarative_base()
+
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record):
+    # WAL lets searches read while a reconcile scan is writing
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+class IndexedObject(Base):
+    __tablename__ = "objects"
+    bucket = Column(String(63), primary_key=True)
+    key = Column(String(1024), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    etag = Column(String(64))
+    last_modified = Column(DateTime)
+    indexed_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_objects_bucket_size", "bucket", "size"),
+        Index("ix_objects_bucket_modified", "bucket", "last_modified"),
+    )
+
+
+class IndexedBucket(Base):
+    __tablename__ = "buckets"
+    bucket = Column(String(63), primary_key=True)
+    last_reconciled = Column(DateTime)
+
+
+class IndexedDigest(Base):
+    """sha256 of an object's content, with the ETag it had when recorded."""
+    __tablename__ = "digests"
+    bucket = Column(String(63), primary_key=True)
+    key = Column(String(1024), primary_key=True)
+    sha256 = Column(String(64), nullable=False, index=True)
+    etag = Column(String(64))
+    size = Column(BigInteger, nullable=False)
+
+
+class BucketSetting(Base):
+    """Per-bucket upload policy."""
+    __tablename__ = "bucket_settings"
+    bucket = Column(String(63), primary_key=True)
+    compression = Column(String(8), nullable=False, default="none")
+
+
+Base.metadata.create_all(bind=engine)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _upsert_rows(db, rows):
+    stmt = sqlite_insert(IndexedObject).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["bucket", "key"],
+        set_={c: stmt.excluded[c] for c in ("size", "etag", "last_modified", "indexed_at")},
+    ))
+
+
+def _register_bucket(db, bucket_name, reconciled=None):
+    stmt = sqlite_insert(IndexedBucket).values(bucket=bucket_name, last_reconciled=reconciled)
+    if reconciled is None:
+        db.execute(stmt.on_conflict_do_nothing())
+    else:
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["bucket"], set_={"last_reconciled": reconciled},
+        ))
+
+
+def _index_complete(db, bucket_name):
+    """True once a full reconcile has run, so a key missing from the index is missing from S3."""
+    indexed = db.get(IndexedBucket, bucket_name)
+    return indexed is not None and indexed.last_reconciled is not None
+
+
+def index_put(bucket_name, key, size, etag=None, last_modified=None):
+    """Record one uploaded object."""
+    with SessionLocal() as db:
+        _register_bucket(db, bucket_name)
+        previous = db.get(IndexedObject, (bucket_name, key))
+        old_size = previous.size if previous else None
+        known = previous is not None or _index_complete(db, bucket_name)
+        _upsert_rows(db, [{
+            "bucket": bucket_name,
+            "key": key,
+            "size": size,
+            "etag": etag.strip('"') if etag else None,
+            "last_modified": last_modified or _utcnow(),
+            "indexed_at": _utcnow(),
+        }])
+        db.commit()
+    if known:
+        usage_cache.record(bucket_name, key, old_size, size)
+    else:
+        # The key may predate the index, so its old size is unknown; rescan instead
+        usage_cache.drop(bucket_name)
+
+
+def index_refresh(bucket_name, key):
+    """Record an object written outside the backend's view of its size (HEAD for the facts)."""
+    head = s3_client.head_object(Bucket=bucket_name, Key=key)
+    index_put(
+        bucket_name, key, head["ContentLength"], head.get("ETag"),
+        head["LastModified"].astimezone(timezone.utc).replace(tzinfo=None),
+    )
+    return head
+
+
+def index_remove(bucket_name, keys):
+    with SessionLocal() as db:
+        complete = _index_complete(db, bucket_name)
+        for start in range(0, len(keys), 500):
+            found = db.execute(select(IndexedObject.key, IndexedObject.size).where(
+                IndexedObject.bucket == bucket_name, IndexedObject.key.in_(keys[start:start + 500]),
+            )).all()
+            for key, size in found:
+                usage_cache.record(bucket_name, key, size, None)
+            if not complete and len(found) < len(keys[start:start + 500]):
+                # Some keys may predate the index; their sizes are unknown, so rescan
+                usage_cache.drop(bucket_name)
+            for model in (IndexedObject, IndexedDigest):
+                db.execute(delete(model).where(
+                    model.bucket == bucket_name, model.key.in_(keys[start:start + 500]),
+                ))
+        db.commit()
+
+
+def index_drop_bucket(bucket_name):
+    usage_cache.drop(bucket_name)
+    with SessionLocal() as db:
+        db.execute(delete(IndexedObject).where(IndexedObject.bucket == bucket_name))
+        db.execute(delete(IndexedDigest).where(IndexedDigest.bucket == bucket_name))
+        db.execute(delete(IndexedBucket).where(IndexedBucket.bucket == bucket_name))
+        db.commit()
+
+
+def digest_put(bucket_name, key, sha256, etag, size):
+    with SessionLocal() as db:
+        stmt = sqlite_insert(IndexedDigest).values(
+            bucket=bucket_name, key=key, sha256=sha256, etag=etag.strip('"') if etag else None, size=size,
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["bucket", "key"],
+            set_={c: stmt.excluded[c] for c in ("sha256", "etag", "size")},
+        ))
+        db.commit()
+
+
+def digest_candidates(sha256, bucket_name):
+    """Objects recorded with this content, same-bucket ones first."""
+    with SessionLocal() as db:
+        rows = db.scalars(select(IndexedDigest).where(IndexedDigest.sha256 == sha256)).all()
+        db.expunge_all()
+    return sorted(rows, key=lambda r: r.bucket != bucket_name)
+
+
+def digest_forget(bucket_name, key):
+    with SessionLocal() as db:
+        db.execute(delete(IndexedDigest).where(IndexedDigest.bucket == bucket_name, IndexedDigest.key == key))
+        db.commit()
+
+
+def reconcile_bucket(bucket_name, on_progress=None):
+    """Re-scan a bucket page by page and make the index match it. Blocking.
+
+    Every object seen is upserted with a fresh indexed_at; rows not touched
+    since the scan began (deleted outside the backend) are removed at the end.
+    Objects uploaded inline during the scan are newer than scan start, so they survive.
+    """
+    scan_started = _utcnow()
+    seen = 0
+    paginator = s3_client.get_paginator("list_objects_v2")
+    with SessionLocal() as db:
+        _register_bucket(db, bucket_name)
+        for page in paginator.paginate(Bucket=bucket_name, PaginationConfig={"PageSize": 1000}):
+            rows = [
+                {
+                    "bucket": bucket_name,
+                    "key": obj["Key"],
+                    "size": obj["Size"],
+                    "etag": obj["ETag"].strip('"'),
+                    "last_modified": obj["LastModified"].astimezone(timezone.utc).replace(tzinfo=None),
+                    "indexed_at": _utcnow(),
+                }
+                for obj in page.get("Contents", [])
+            ]
+            if rows:
+                # SQLite caps bound parameters per statement, so insert in slices
+                for start in range(0, len(rows), 100):
+                    _upsert_rows(db, rows[start:start + 100])
+                db.commit()
+            seen += len(rows)
+            if on_progress:
+                on_progress(seen)
+
+        removed = db.execute(delete(IndexedObject).where(
+            IndexedObject.bucket == bucket_name, IndexedObject.indexed_at < scan_started,
+        )).rowcount
+        _register_bucket(db, bucket_name, reconciled=_utcnow())
+        db.commit()
+    return {"bucket_name": bucket_name, "objects": seen, "removed": removed}
+
+
+async def _reconcile_job(job, bucket_name):
+    loop = asyncio.get_running_loop()
+
+    def progress(seen):
+        loop.call_soon_threadsafe(job.log.append, f"Indexed {seen} objects")
+
+    start = time.perf_counter()
+    result = await loop.run_in_executor(None, reconcile_bucket, bucket_name, progress)
+    job.timings["reconcile"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def reconcile_periodically():
+    """Reconcile every indexed bucket (and every provisioned one) on a fixed interval."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(INDEX_RECONCILE_SECONDS)
+        with SessionLocal() as db:
+            buckets = set(db.scalars(select(IndexedBucket.bucket)))
+        if os.path.isdir(WORKSPACES_DIR):
+            buckets.update(os.listdir(WORKSPACES_DIR))
+        for bucket_name in sorted(buckets):
+            try:
+                result = await loop.run_in_executor(None, reconcile_bucket, bucket_name)
+                print(f"[INFO] Reconciled index for {bucket_name}: {result}")
+            except Exception as e:
+                print(f"[WARN] Index reconcile failed for {bucket_name}: {e}")
+
+
+@app.on_event("startup")
+async def start_index_reconciler():
+    asyncio.create_task(reconcile_periodically())
+
+
+# -------------------------------------------------
+# READINESS
+# -------------------------------------------------
+async def bucket_exists(bucket_name):
     try:
-        # Create a temporary Terraform file
-        tf_path = os.path.join(TF_DIR, "main.tf")
-        with open(tf_path, "w") as f:
-            f.write(f"""
+        await s3.head_bucket(Bucket=bucket_name)
+        return True
+    except ClientError:
+        return False
+
+
+async def wait_for_bucket(job, bucket_name):
+    """Poll head_bucket until the new bucket is usable; record time-to-ready."""
+    start = time.perf_counter()
+    await wait_until(
+        lambda: bucket_exists(bucket_name), READY_TIMEOUT_SECONDS, f"bucket '{bucket_name}'", job,
+        **READY_POLL_DELAYS,
+    )
+    job.timings["ready_wait"] = round(time.perf_counter() - start, 3)
+    job.timings["time_to_ready"] = round(time.time() - job.started_at, 3)
+
+
+# -------------------------------------------------
+# WORKSPACES
+# -------------------------------------------------
+# Rendered into its own workspace per bucket, so each bucket has its own
+# state and creating one bucket never orphans another
+BUCKET_TF_TEMPLATE = """
 provider "aws" {{
-  region = "{AWS_REGION}"
+  region = "{region}"
 }}
 
 resource "aws_s3_bucket" "files_bucket" {{
@@ -108,42 +573,1053 @@ resource "aws_s3_bucket_policy" "public_policy" {{
 output "bucket_url" {{
   value = "https://${{aws_s3_bucket.files_bucket.bucket}}.s3.amazonaws.com/"
 }}
-""")
+"""
+
+# Written next to main.tf when a bucket is created with boto3; the next
+# plan/apply imports the existing resources instead of creating them
+BUCKET_IMPORTS_TEMPLATE = """
+import {{
+  to = aws_s3_bucket.files_bucket
+  id = "{bucket_name}"
+}}
+
+import {{
+  to = aws_s3_bucket_public_access_block.public_access
+  id = "{bucket_name}"
+}}
+
+import {{
+  to = aws_s3_bucket_ownership_controls.ownership
+  id = "{bucket_name}"
+}}
+
+import {{
+  to = aws_s3_bucket_acl.bucket_acl
+  id = "{bucket_name},public-read"
+}}
+
+import {{
+  to = aws_s3_bucket_policy.public_policy
+  id = "{bucket_name}"
+}}
+"""
+
+outputs_cache = OutputsCache()
+
+
+BUCKET_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9.-]{1,61}[a-z0-9]$")
+
+
+def workspace_dir(bucket_name):
+    """Isolated Terraform working directory for one bucket."""
+    if not BUCKET_NAME_RE.match(bucket_name):
+        raise HTTPException(status_code=400, detail=f"Invalid bucket name '{bucket_name}'")
+    return os.path.join(WORKSPACES_DIR, bucket_name)
+
 
+def prepare_workspace(bucket_name):
+    """Render the bucket template into its workspace and return the path."""
+    path = workspace_dir(bucket_name)
+    os.makedirs(path, exist_ok=True)
+    content = BUCKET_TF_TEMPLATE.format(region=AWS_REGION, bucket_name=bucket_name)
+    tf_path = os.path.join(path, "main.tf")
+    if os.path.exists(tf_path):
+        with open(tf_path) as f:
+            if f.read() == content:
+                return path
+    with open(tf_path, "w") as f:
+        f.write(content)
+    return path
+
+
+def migrate_legacy_state():
+    """Move state from before per-bucket workspaces into that bucket's workspace.
+
+    Terraform used to run directly in TF_DIR, so its state holds the last
+    bucket created there; moving it keeps that bucket destroyable via the API.
+    """
+    legacy = os.path.join(TF_DIR, "terraform.tfstate")
+    if not os.path.exists(legacy):
+        return
+    with open(legacy, encoding="utf-8") as f:
+        state = json.load(f)
+    buckets = [
+        instance["attributes"]["bucket"]
+        for resource in state.get("resources", [])
+        if resource.get("type") == "aws_s3_bucket"
+        for instance in resource.get("instances", [])
+    ]
+    if not buckets:
+        print(f"[WARN] Legacy state {legacy} not migrated: it holds no bucket")
+        return
+    path = prepare_workspace(buckets[0])
+    if os.path.exists(os.path.join(path, "terraform.tfstate")):
+        print(f"[WARN] Legacy state {legacy} not migrated: {path} already has a state file")
+        return
+    for name in ("terraform.tfstate", "terraform.tfstate.backup"):
+        src = os.path.join(TF_DIR, name)
+        if os.path.exists(src):
+            shutil.move(src, os.path.join(path, name))
+    print(f"[INFO] Migrated legacy Terraform state for {buckets[0]} into {path}")
+
+
+@app.on_event("startup")
+async def start_state_migration():
+    migrate_legacy_state()
+
+
+app.include_router(workspaces_router(WORKSPACES_DIR, "bucket_name", outputs_cache))
+
+
+# -------------------------------------------------
+# CREATE BUCKET (via Terraform)
+# -------------------------------------------------
+async def _create_bucket(job, bucket_name):
+    path = prepare_workspace(bucket_name)
+    async with dir_lock(path):
         # Run Terraform commands automatically
-        subprocess.run(["terraform", "init", "-upgrade"], cwd=TF_DIR, check=True)
-        
-        time.sleep(10)  # 👈 give AWS a few seconds
+        await terraform_init(job, cwd=path)
+        await terraform(job, "apply", "-auto-approve", cwd=path)
+        await wait_for_bucket(job, bucket_name)
 
-        subprocess.run(["terraform", "apply", "-auto-approve"], cwd=TF_DIR, check=True)
+    return {"message": f"S3 bucket '{bucket_name}' created successfully via Terraform."}
 
-        return {"message": f"S3 bucket '{bucket_name}' created successfully via Terraform."}
-    except subprocess.CalledProcessError as e:
-        return {"detail": f"Terraform error: {e}"}
-    except Exception as e:
-        return {"detail": str(e)}
+
+async def _create_bucket_direct(job, bucket_name):
+    """Create the same resources as BUCKET_TF_TEMPLATE with boto3, independent calls in parallel.
+
+    The workspace gets main.tf plus imports.tf, so `terraform apply` there
+    later adopts the bucket into state instead of recreating it. imports.tf
+    is written as soon as the bucket exists and also marks it as ours for
+    delete; an existing bucket is refused, never reconfigured.
+    """
+    try:
+        await s3.head_bucket(Bucket=bucket_name)
+        exists = True
+    except ClientError as e:
+        exists = e.response["Error"]["Code"] not in ("404", "NoSuchBucket")
+    if exists:
+        # us-east-1 answers create_bucket with 200 for a bucket we already own
+        raise RuntimeError(f"Bucket '{bucket_name}' already exists; not creating or changing it")
+
+    path = prepare_workspace(bucket_name)
+    imports_path = os.path.join(path, "imports.tf")
+
+    async def step(name, *calls):
+        start = time.perf_counter()
+        await asyncio.gather(*calls)
+        job.timings[name] = round(time.perf_counter() - start, 3)
+        job.log.append(f"{name}: done in {job.timings[name]}s")
+
+    policy = {
+        "Version": "2012-10-17",
+        "Statement": [{
+            "Sid": "PublicReadAccess",
+            "Effect": "Allow",
+            "Principal": "*",
+            "Action": ["s3:GetObject"],
+            "Resource": f"arn:aws:s3:::{bucket_name}/*",
+        }],
+    }
+    location = {} if AWS_REGION == "us-east-1" else {
+        "CreateBucketConfiguration": {"LocationConstraint": AWS_REGION}
+    }
+
+    try:
+        async with dir_lock(path):
+            await step("create_bucket", s3.create_bucket(Bucket=bucket_name, **location))
+            with open(imports_path, "w") as f:
+                f.write(BUCKET_IMPORTS_TEMPLATE.format(bucket_name=bucket_name))
+            await step(
+                "ownership_and_public_access",
+                s3.put_bucket_ownership_controls(Bucket=bucket_name, OwnershipControls={
+                    "Rules": [{"ObjectOwnership": "BucketOwnerPreferred"}]
+                }),
+                s3.put_public_access_block(Bucket=bucket_name, PublicAccessBlockConfiguration={
+                    "BlockPublicAcls": False,
+                    "IgnorePublicAcls": False,
+                    "BlockPublicPolicy": False,
+                    "RestrictPublicBuckets": False,
+                }),
+            )
+            await step(
+                "acl_and_policy",
+                s3.put_bucket_acl(Bucket=bucket_name, ACL="public-read"),
+                s3.put_bucket_policy(Bucket=bucket_name, Policy=json.dumps(policy)),
+            )
+    except BaseException:
+        if not os.path.exists(imports_path):
+            # The bucket was never created; leave no workspace that delete could mistake for ours
+            shutil.rmtree(path, ignore_errors=True)
+            forget_dir_lock(path)
+        raise
+
+    return {
+        "message": f"S3 bucket '{bucket_name}' created successfully via boto3.",
+        "bucket_url": f"https://{bucket_name}.s3.amazonaws.com/",
+    }
+
+
+async def _adopt_bucket(job, bucket_name):
+    path = workspace_dir(bucket_name)
+    async with dir_lock(path):
+        await terraform_init(job, cwd=path)
+        await terraform(job, "apply", "-auto-approve", cwd=path)
+    return {"message": f"S3 bucket '{bucket_name}' is now managed by Terraform."}
+
+
+@app.post("/bucket/create")
+async def create_bucket(bucket_name: str = Form(...), engine: Optional[str] = Form(None)):
+    """Queue bucket creation; follow /jobs/{job_id}/stream for progress.
+
+    engine is "terraform" or "boto3" (default S3_PROVISION_ENGINE).
+    """
+    engine = engine or S3_PROVISION_ENGINE
+    if engine not in PROVISION_ENGINES:
+        raise HTTPException(status_code=400, detail=f"engine must be one of {', '.join(PROVISION_ENGINES)}")
+    workspace_dir(bucket_name)
+    if engine == "boto3":
+        job = start_job("create_bucket", _create_bucket_direct, bucket_name)
+    else:
+        job = start_job("create_bucket", _create_bucket, bucket_name)
+    return {"status": job.status, "job_id": job.id, "engine": engine}
+
+
+@app.post("/bucket/{bucket_name}/adopt")
+async def adopt_bucket(bucket_name: str):
+    """Bring a boto3-created bucket into Terraform state using its import blocks."""
+    if not os.path.exists(os.path.join(workspace_dir(bucket_name), "imports.tf")):
+        raise HTTPException(status_code=404, detail=f"Bucket '{bucket_name}' was not created with boto3")
+    job = start_job("adopt_bucket", _adopt_bucket, bucket_name)
+    return {"status": job.status, "job_id": job.id}
+
+
+# -------------------------------------------------
+# DEDUP (content-addressed uploads)
+# -------------------------------------------------
+# Objects uploaded with dedup carry their sha256 in x-amz-meta-sha256 and in
+# the local digest table. A repeat upload is skipped when the target key
+# already holds the content, or becomes a server-side copy when another key does.
+dedup_stats = {"checked": 0, "skipped": 0, "copied": 0, "uploaded": 0, "bytes_saved": 0}
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _sha256_fileobj(fileobj):
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(1024 * 1024), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def _holds_digest(bucket_name, key, sha256, recorded_etag=None):
+    """HEAD the object; True when its metadata (or unchanged ETag) proves it has this content."""
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    if head.get("Metadata", {}).get("sha256") == sha256:
+        return head
+    if recorded_etag and head["ETag"].strip('"') == recorded_etag:
+        return head
+    return None
+
+
+def find_duplicate(bucket_name, key, sha256):
+    """Satisfy an upload from content S3 already has. Blocking.
+
+    Returns {"dedup": "skipped" | "copied", ...} or None when the bytes
+    really need to be transferred. Stale digest rows are dropped on the way.
+    """
+    head = _holds_digest(bucket_name, key, sha256)
+    if head:
+        digest_put(bucket_name, key, sha256, head["ETag"], head["ContentLength"])
+        return {"dedup": "skipped", "bytes_saved": head["ContentLength"]}
+
+    for cand in digest_candidates(sha256, bucket_name):
+        if (cand.bucket, cand.key) == (bucket_name, key):
+            continue
+        head = _holds_digest(cand.bucket, cand.key, sha256, cand.etag)
+        if not head:
+            digest_forget(cand.bucket, cand.key)
+            continue
+        # Managed copy: a single copy_object up to the multipart threshold, part copies above
+        s3_client.copy(
+            {"Bucket": cand.bucket, "Key": cand.key}, bucket_name, key,
+            ExtraArgs={
+                "ACL": "public-read",
+                "ContentType": head.get("ContentType", "application/octet-stream"),
+                # Compressed sources stay compressed; keep the encoding with them
+                **({"ContentEncoding": head["ContentEncoding"]} if head.get("ContentEncoding") else {}),
+                "Metadata": {**head.get("Metadata", {}), "sha256": sha256},
+                "MetadataDirective": "REPLACE",
+            },
+            Config=TRANSFER_CONFIG,
+        )
+        copied = index_refresh(bucket_name, key)
+        digest_put(bucket_name, key, sha256, copied["ETag"], copied["ContentLength"])
+        return {
+            "dedup": "copied",
+            "source": f"{cand.bucket}/{cand.key}",
+            "bytes_saved": head["ContentLength"],
+        }
+    return None
+
+
+def _count_dedup(outcome):
+    dedup_stats["checked"] += 1
+    dedup_stats[outcome["dedup"]] += 1
+    dedup_stats["bytes_saved"] += outcome.get("bytes_saved", 0)
+
+
+@app.get("/dedup/stats")
+def get_dedup_stats():
+    return dedup_stats
+
+
+# -------------------------------------------------
+# COMPRESSION (gzip / zstd with Content-Encoding)
+# -------------------------------------------------
+# Compressible uploads are encoded on the way in and stored with
+# Content-Encoding, so S3 and presigned GETs serve them to browsers as-is;
+# /bucket/{bucket}/object/{key} decodes for clients that cannot.
+CODECS = ("none", "gzip", "zstd")
+
+# Not in every platform's mime table, but the most common compressible uploads
+mimetypes.add_type("text/plain", ".log")
+mimetypes.add_type("application/x-ndjson", ".ndjson")
+
+
+def _compressor(codec):
+    if codec == "gzip":
+        return zlib.compressobj(S3_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return zstandard.ZstdCompressor(level=S3_ZSTD_LEVEL).compressobj()
+
+
+def _decompressor(codec):
+    if codec == "gzip":
+        return zlib.decompressobj(31)
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def _is_compressible(content_type):
+    return any(content_type.startswith(t.strip()) for t in S3_COMPRESS_TYPES if t.strip())
+
+
+def bucket_compression(bucket_name):
+    with SessionLocal() as db:
+        setting = db.get(BucketSetting, bucket_name)
+    return setting.compression if setting else S3_COMPRESS_DEFAULT
+
+
+def choose_codec(bucket_name, content_type, requested=None):
+    """Codec for one upload: the per-upload choice, else the bucket policy; None if not compressing."""
+    codec = requested or bucket_compression(bucket_name)
+    if codec not in CODECS:
+        raise HTTPException(status_code=400, detail=f"compress must be one of {', '.join(CODECS)}")
+    if codec == "zstd" and zstandard is None:
+        raise HTTPException(status_code=400, detail="zstd needs the 'zstandard' package on the server")
+    if codec == "none" or not _is_compressible(content_type):
+        return None
+    return codec
+
+
+def policy_codec(bucket_name, content_type):
+    """Codec the bucket policy applies to this content type, or None.
+
+    Presigned uploads go straight to S3 and are never compressed; they report
+    this so clients can send such files through /stream instead.
+    """
+    codec = bucket_compression(bucket_name)
+    return codec if codec != "none" and _is_compressible(content_type) else None
+
+
+class _CompressingReader:
+    """read()-only view of a file, compressed on the fly (for upload_fileobj)."""
+
+    def __init__(self, fileobj, codec):
+        self._fileobj = fileobj
+        self._compressor = _compressor(codec)
+        self._buffer = b""
+        self._eof = False
+        self.bytes_in = 0
+
+    def read(self, n=-1):
+        while not self._eof and (n < 0 or len(self._buffer) < n):
+            chunk = self._fileobj.read(1024 * 1024)
+            if chunk:
+                self.bytes_in += len(chunk)
+                self._buffer += self._compressor.compress(chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+        if n < 0:
+            n = len(self._buffer)
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        return data
+
+
+async def _compress_stream(chunks, codec, counter):
+    compressor = _compressor(codec)
+    async for chunk in chunks:
+        counter["bytes_in"] += len(chunk)
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+class CompressionModel(BaseModel):
+    codec: str
+
+
+@app.get("/bucket/{bucket_name}/compression")
+def get_bucket_compression(bucket_name: str):
+    return {"bucket_name": bucket_name, "codec": bucket_compression(bucket_name), "types": S3_COMPRESS_TYPES}
+
+
+@app.put("/bucket/{bucket_name}/compression")
+def set_bucket_compression(bucket_name: str, req: CompressionModel):
+    """Compress future uploads of compressible types into this bucket with `codec`."""
+    choose_codec(bucket_name, "text/plain", req.codec)
+    with SessionLocal() as db:
+        stmt = sqlite_insert(BucketSetting).values(bucket=bucket_name, compression=req.codec)
+        db.execute(stmt.on_conflict_do_update(index_elements=["bucket"], set_={"compression": req.codec}))
+        db.commit()
+    return {"bucket_name": bucket_name, "codec": req.codec}
 
 
 # -------------------------------------------------
 # UPLOAD FILE TO S3
 # -------------------------------------------------
 @app.post("/bucket/upload")
-async def upload_file(bucket_name: str = Form(...), file: UploadFile = Form(...)):
+async def upload_file(
+    bucket_name: str = Form(...),
+    file: UploadFile = Form(...),
+    dedup: bool = Form(False),
+    sha256: Optional[str] = Form(None),
+    compress: Optional[str] = Form(None),
+):
+    """Upload one file. With dedup, content S3 already holds is skipped or copied server-side;
+    the file is already fully received, so it is always hashed here and a client
+    sha256 (hex) must match it. compress ("none", "gzip", "zstd") overrides the
+    bucket's compression policy."""
     try:
         content_type = (
             file.content_type
             or mimetypes.guess_type(file.filename)[0]
             or "application/octet-stream"
         )
+        extra_args = {"ACL": "public-read", "ContentType": content_type}
 
-        s3_client.upload_fileobj(
-            file.file,
-            bucket_name,
-            file.filename,
-            ExtraArgs={"ACL": "public-read", "ContentType": content_type},
+        loop = asyncio.get_running_loop()
+        digest = None
+        if dedup:
+            if sha256 and not SHA256_RE.match(sha256.lower()):
+                raise HTTPException(status_code=400, detail="sha256 must be 64 hex characters")
+            digest = await loop.run_in_executor(transfer_executor, _sha256_fileobj, file.file)
+            if sha256 and sha256.lower() != digest:
+                raise HTTPException(status_code=400, detail="sha256 does not match the uploaded file")
+            outcome = await s3.run(find_duplicate, bucket_name, file.filename, digest)
+            if outcome:
+                _count_dedup(outcome)
+                return {"message": f"File '{file.filename}' already stored; upload {outcome['dedup']}.", **outcome}
+            extra_args["Metadata"] = {"sha256": digest}
+
+        source = file.file
+        codec = await loop.run_in_executor(None, choose_codec, bucket_name, content_type, compress)
+        if codec:
+            extra_args["ContentEncoding"] = codec
+            source = _CompressingReader(file.file, codec)
+
+        await loop.run_in_executor(
+            transfer_executor,
+            partial(
+                s3_client.upload_fileobj,
+                source,
+                bucket_name,
+                file.filename,
+                ExtraArgs=extra_args,
+                Config=TRANSFER_CONFIG,
+            ),
         )
+        head = await s3.run(index_refresh, bucket_name, file.filename)
+
+        result = {"message": f"File '{file.filename}' uploaded successfully."}
+        if codec:
+            result.update(compression=codec, original_size=source.bytes_in, stored_size=head["ContentLength"])
+        if digest:
+            await loop.run_in_executor(
+                None, digest_put, bucket_name, file.filename, digest, head["ETag"], head["ContentLength"]
+            )
+            _count_dedup({"dedup": "uploaded"})
+            result.update(dedup="uploaded", bytes_saved=0)
 
-        return {"message": f"File '{file.filename}' uploaded successfully."}
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        return {"detail": str(e)}
+
+
+# -------------------------------------------------
+# STREAMING UPLOAD (no spooling)
+# -------------------------------------------------
+async def stream_to_s3(body, bucket_name, key, extra_args):
+    """Upload an async iterator of bytes to S3 as multipart parts while it is still arriving.
+
+    Bodies smaller than one part become a single put_object. Reading from
+    `body` pauses while S3_STREAM_MAX_INFLIGHT parts are uploading, so the
+    client is throttled instead of the server buffering.
+    """
+    loop = asyncio.get_running_loop()
+    part_size = S3_STREAM_PART_MB * 1024 * 1024
+    slots = asyncio.Semaphore(S3_STREAM_MAX_INFLIGHT)
+
+    def call(fn, **kwargs):
+        return loop.run_in_executor(transfer_executor, partial(fn, **kwargs))
+
+    upload_id = None
+    parts = []
+    buffer = bytearray()
+    total = 0
+
+    async def send_part(number, data):
+        try:
+            resp = await call(
+                s3_client.upload_part,
+                Bucket=bucket_name, Key=key, UploadId=upload_id, PartNumber=number, Body=data,
+            )
+            return {"PartNumber": number, "ETag": resp["ETag"]}
+        finally:
+            slots.release()
+
+    async def flush(data):
+        nonlocal upload_id
+        if upload_id is None:
+            resp = await call(s3_client.create_multipart_upload, Bucket=bucket_name, Key=key, **extra_args)
+            upload_id = resp["UploadId"]
+        await slots.acquire()
+        for task in parts:
+            if task.done() and task.exception():
+                raise task.exception()
+        parts.append(asyncio.create_task(send_part(len(parts) + 1, data)))
+
+    try:
+        async for chunk in body:
+            total += len(chunk)
+            buffer += chunk
+            while len(buffer) >= part_size:
+                data = bytes(buffer[:part_size])
+                del buffer[:part_size]
+                await flush(data)
+
+        if upload_id is None:
+            resp = await call(s3_client.put_object, Bucket=bucket_name, Key=key, Body=bytes(buffer), **extra_args)
+            return {"size": total, "parts": 1, "etag": resp["ETag"].strip('"')}
+
+        if buffer:
+            await flush(bytes(buffer))
+        completed = await asyncio.gather(*parts)
+        resp = await call(
+            s3_client.complete_multipart_upload,
+            Bucket=bucket_name, Key=key, UploadId=upload_id, MultipartUpload={"Parts": completed},
+        )
+        return {"size": total, "parts": len(completed), "etag": resp["ETag"].strip('"')}
+    except BaseException:
+        for task in parts:
+            task.cancel()
+        if upload_id is not None:
+            await asyncio.shield(
+                call(s3_client.abort_multipart_upload, Bucket=bucket_name, Key=key, UploadId=upload_id)
+            )
+        raise
+
+
+@app.put("/bucket/{bucket_name}/stream/{key:path}")
+async def stream_upload(
+    bucket_name: str,
+    key: str,
+    request: Request,
+    dedup: bool = False,
+    compress: Optional[str] = None,
+    x_content_sha256: Optional[str] = Header(None),
+):
+    """Upload the raw request body to S3 as it arrives, without spooling it to disk.
+
+    With dedup and an X-Content-SHA256 header, content S3 already holds is
+    skipped or copied before a single body byte is read. That decision trusts
+    the header: a wrong digest can skip the upload or copy other content under
+    this key, so only trusted clients (such as sync_client.py, which hashes
+    the file it sends) should combine the two. When the body is uploaded, it
+    is checked against the header and the object is removed on a mismatch.
+    Compressible types are encoded in flight per `compress` or the bucket policy.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        content_type = (
+            request.headers.get("content-type")
+            or mimetypes.guess_type(key)[0]
+            or "application/octet-stream"
+        )
+        extra_args = {"ACL": "public-read", "ContentType": content_type}
+        body = request.stream()
+
+        digest = x_content_sha256.lower() if x_content_sha256 else None
+        if digest and not SHA256_RE.match(digest):
+            raise HTTPException(status_code=400, detail="X-Content-SHA256 must be 64 hex characters")
+        if dedup and digest:
+            outcome = await s3.run(find_duplicate, bucket_name, key, digest)
+            if outcome:
+                _count_dedup(outcome)
+                return {"message": f"File '{key}' already stored; upload {outcome['dedup']}.", **outcome}
+
+        hasher = None
+        if dedup or digest:
+            if digest:
+                extra_args["Metadata"] = {"sha256": digest}
+            hasher = hashlib.sha256()
+
+            async def hashed(chunks):
+                async for chunk in chunks:
+                    hasher.update(chunk)
+                    yield chunk
+
+            body = hashed(body)
+
+        counter = {"bytes_in": 0}
+        codec = await loop.run_in_executor(None, choose_codec, bucket_name, content_type, compress)
+        if codec:
+            extra_args["ContentEncoding"] = codec
+            body = _compress_stream(body, codec, counter)
+
+        result = await stream_to_s3(body, bucket_name, key, extra_args)
+        if codec:
+            result.update(compression=codec, original_size=counter["bytes_in"])
+
+        if hasher:
+            actual = hasher.hexdigest()
+            if digest and actual != digest:
+                await s3.delete_object(Bucket=bucket_name, Key=key)
+                raise HTTPException(status_code=400, detail="X-Content-SHA256 does not match the uploaded body")
+            await loop.run_in_executor(None, digest_put, bucket_name, key, actual, result["etag"], result["size"])
+            result["sha256"] = actual
+            if dedup:
+                _count_dedup({"dedup": "uploaded"})
+                result.update(dedup="uploaded", bytes_saved=0)
+
+        await loop.run_in_executor(
+            None, index_put, bucket_name, key, result["size"], result["etag"],
+        )
+        return {"message": f"File '{key}' uploaded successfully.", **result}
+    except HTTPException:
+        raise
+    except Exception as e:
+        return {"detail": str(e)}
+
+
+# -------------------------------------------------
+# ARCHIVE EXPANSION (zip / tar / tar.gz, streamed)
+# -------------------------------------------------
+class _BodyReader:
+    """Blocking read() over an async byte stream, for parsers running in a worker thread.
+
+    Each read pulls chunks from the event loop on demand, so the client is
+    only read as fast as the archive is being expanded.
+    """
+
+    def __init__(self, body, loop):
+        self._iter = body.__aiter__()
+        self._loop = loop
+        self._buffer = b""
+        self._eof = False
+
+    async def _pull(self):
+        return await self._iter.__anext__()
+
+    def read(self, n=-1):
+        while not self._eof and (n < 0 or len(self._buffer) < n):
+            try:
+                self._buffer += asyncio.run_coroutine_threadsafe(self._pull(), self._loop).result()
+            except StopAsyncIteration:
+                self._eof = True
+        if n < 0:
+            n = len(self._buffer)
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        return data
+
+    def read_exact(self, n):
+        data = self.read(n)
+        if len(data) != n:
+            raise ValueError("Archive ended unexpectedly")
+        return data
+
+    def unread(self, data):
+        self._buffer = data + self._buffer
+
+
+class _ZipEntryReader:
+    """read() for one zip entry straight off the stream (stored or deflated)."""
+
+    CHUNK = 64 * 1024
+
+    def __init__(self, src, method, compressed_size, has_descriptor, zip64):
+        self._src = src
+        self._remaining = compressed_size
+        self._inflater = zlib.decompressobj(-15) if method == 8 else None
+        self._has_descriptor = has_descriptor
+        self._zip64 = zip64
+        self._pending = b""
+        self._done = False
+
+    def _finish(self):
+        self._done = True
+        if self._has_descriptor:
+            # Optional signature, then CRC and the two sizes (8 bytes each for zip64)
+            head = self._src.read_exact(4)
+            if head != b"PK\x07\x08":
+                self._src.unread(head)
+            self._src.read_exact(20 if self._zip64 else 12)
+
+    def read(self, n=-1):
+        out = bytearray(self._pending)
+        self._pending = b""
+        while not self._done and (n < 0 or len(out) < n):
+            if self._remaining == 0:
+                self._finish()
+                break
+            want = self.CHUNK if self._remaining is None else min(self.CHUNK, self._remaining)
+            raw = self._src.read(want)
+            if not raw:
+                raise ValueError("Archive ended unexpectedly")
+            if self._remaining is not None:
+                self._remaining -= len(raw)
+            if self._inflater is None:
+                out += raw
+                continue
+            out += self._inflater.decompress(raw)
+            if self._inflater.eof:
+                self._src.unread(self._inflater.unused_data)
+                if self._remaining is not None:
+                    self._remaining = 0
+                self._finish()
+        if 0 <= n < len(out):
+            self._pending = bytes(out[n:])
+            del out[n:]
+        return bytes(out)
+
+    def drain(self):
+        while self.read(self.CHUNK):
+            pass
+
+
+def _iter_zip(src):
+    """Yield (name, reader) for each file in a zip, reading local headers in order.
+
+    Stops at the central directory, so the archive never has to be seekable.
+    Entries with a data descriptor are only supported when deflated, since
+    that is the only way to find where their data ends, or when they are
+    stored directories, which have no data.
+    """
+    while True:
+        signature = src.read(4)
+        if signature != b"PK\x03\x04":
+            return
+        (_, flags, method, _, _, _, csize, _, name_len, extra_len) = struct.unpack(
+            "<HHHHHIIIHH", src.read_exact(26)
+        )
+        name = src.read_exact(name_len).decode("utf-8" if flags & 0x800 else "cp437")
+        extra = src.read_exact(extra_len)
+        zip64 = False
+        pos = 0
+        while pos + 4 <= len(extra):
+            field, size = struct.unpack("<HH", extra[pos:pos + 4])
+            if field == 0x0001:
+                zip64 = True
+                if csize == 0xFFFFFFFF:
+                    # Uncompressed size comes first, then compressed size
+                    csize = struct.unpack("<QQ", extra[pos + 4:pos + 20])[1]
+            pos += 4 + size
+
+        has_descriptor = bool(flags & 0x08)
+        if flags & 0x01:
+            raise ValueError(f"'{name}' is encrypted")
+        if has_descriptor and method == 0 and name.endswith("/"):
+            csize, has_size = 0, True
+        else:
+            has_size = not has_descriptor
+        if method not in (0, 8) or not (has_size or method == 8):
+            if has_descriptor:
+                raise ValueError(f"'{name}' uses compression method {method} with a data descriptor")
+            src.read_exact(csize)
+            yield name, None
+            continue
+
+        reader = _ZipEntryReader(src, method, csize if has_size else None, has_descriptor, zip64)
+        yield name, reader
+        reader.drain()
+
+
+def _iter_tar(src):
+    """Yield (name, reader) for each member of a (possibly compressed) tar stream."""
+    with tarfile.open(fileobj=src, mode="r|*") as tar:
+        for member in tar:
+            if member.isdir():
+                continue
+            yield member.name, tar.extractfile(member) if member.isfile() else None
+
+
+class _Prepended:
+    """A read()-only stream: `head` followed by the rest of `rest`."""
+
+    def __init__(self, head, rest):
+        self._head = head
+        self._rest = rest
+
+    def read(self, n=-1):
+        if not self._head:
+            return self._rest.read(n)
+        if n < 0:
+            data, self._head = self._head + self._rest.read(), b""
+            return data
+        data, self._head = self._head[:n], self._head[n:]
+        return data
+
+
+def _archive_path(name):
+    """Entry name as a clean relative path ("./a.txt" -> "a.txt"), or None if it has a ".." segment."""
+    if ".." in name.split("/"):
+        return None
+    path = posixpath.normpath(name).lstrip("/")
+    return None if path == "." else path
+
+
+def expand_archive(src, bucket_name, prefix):
+    """Upload every file in a zip/tar stream under `prefix`. Blocking; returns the manifest."""
+    magic = src.read(4)
+    src.unread(magic)
+    entries = _iter_zip(src) if magic == b"PK\x03\x04" else _iter_tar(src)
+
+    threshold = S3_MULTIPART_THRESHOLD_MB * 1024 * 1024
+    slots = threading.BoundedSemaphore(S3_EXPAND_MAX_INFLIGHT)
+    manifest = []
+    pending = []
+
+    def upload_small(entry, data):
+        try:
+            resp = s3_client.put_object(
+                Bucket=bucket_name, Key=entry["key"], Body=data,
+                ACL="public-read", ContentType=entry["content_type"],
+            )
+            entry.update(status="uploaded", etag=resp["ETag"].strip('"'))
+            index_put(bucket_name, entry["key"], entry["size"], entry["etag"])
+        except Exception as e:
+            entry.update(status="failed", error=str(e))
+        finally:
+            slots.release()
+
+    error = None
+    try:
+        for name, reader in entries:
+            path = _archive_path(name)
+            key = prefix + (path or name)
+            entry = {
+                "key": key,
+                "size": 0,
+                "content_type": mimetypes.guess_type(key)[0] or "application/octet-stream",
+            }
+            manifest.append(entry)
+            if name.endswith("/"):
+                entry["status"] = "skipped"
+                continue
+            if path is None:
+                entry.update(status="skipped", error="path leaves the archive root")
+                continue
+            if reader is None:
+                entry.update(status="skipped", error="not a regular file or unsupported compression")
+                continue
+
+            head = reader.read(threshold + 1)
+            if len(head) <= threshold:
+                entry["size"] = len(head)
+                slots.acquire()
+                pending.append(expand_executor.submit(upload_small, entry, head))
+                continue
+
+            # Too big to buffer: multipart upload while reading it off the archive
+            try:
+                s3_client.upload_fileobj(
+                    _Prepended(head, reader), bucket_name, key,
+                    ExtraArgs={"ACL": "public-read", "ContentType": entry["content_type"]},
+                    Config=TRANSFER_CONFIG,
+                )
+                head_resp = s3_client.head_object(Bucket=bucket_name, Key=key)
+                entry.update(status="uploaded", size=head_resp["ContentLength"], etag=head_resp["ETag"].strip('"'))
+                index_put(bucket_name, key, entry["size"], entry["etag"])
+            except Exception as e:
+                entry.update(status="failed", error=str(e))
+    except Exception as e:
+        # A corrupt or truncated archive: keep what was uploaded, report where it stopped
+        error = str(e)
+
+    for future in pending:
+        future.result()
+
+    counts = {}
+    for entry in manifest:
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    return {
+        "entries": len(manifest),
+        "uploaded": counts.get("uploaded", 0),
+        "failed": counts.get("failed", 0),
+        "skipped": counts.get("skipped", 0),
+        "bytes": sum(e["size"] for e in manifest if e["status"] == "uploaded"),
+        "error": error,
+        "manifest": manifest,
+    }
+
+
+@app.post("/bucket/{bucket_name}/expand")
+async def expand_upload(bucket_name: str, request: Request, prefix: str = ""):
+    """Expand a zip, tar, tar.gz/bz2/xz request body into the bucket as it arrives.
+
+    Nothing is written to disk; each entry becomes `prefix + entry name` and
+    the response lists the outcome for every entry.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        src = _BodyReader(request.stream(), loop)
+        result = await loop.run_in_executor(archive_executor, expand_archive, src, bucket_name, prefix)
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        return result
+    except Exception as e:
+        return {"detail": str(e)}
+
+
+# -------------------------------------------------
+# PRESIGNED DIRECT-TO-S3 TRANSFERS
+# -------------------------------------------------
+# The backend only signs; the bytes go straight between the client and S3.
+def _content_type(key, content_type=None):
+    return content_type or mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+@app.post("/bucket/{bucket_name}/presign")
+def presign(bucket_name: str, req: PresignModel):
+    """Presigned GET, PUT or POST for one object.
+
+    PUT and POST uploads must send the returned headers/fields unchanged.
+    They bypass the bucket's compression policy; "skips_compression" names
+    the codec a /stream upload of the same file would have used.
+    """
+    try:
+        if req.method == "get":
+            params = {"Bucket": bucket_name, "Key": req.key}
+            if req.download:
+                filename = req.key.rsplit("/", 1)[-1].replace('"', "")
+                params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
+            url = s3_client.generate_presigned_url("get_object", Params=params, ExpiresIn=req.expires_in)
+            return {"method": "GET", "url": url}
+
+        content_type = _content_type(req.key, req.content_type)
+        if req.method == "put":
+            url = s3_client.generate_presigned_url(
+                "put_object",
+                Params={"Bucket": bucket_name, "Key": req.key, "ACL": "public-read", "ContentType": content_type},
+                ExpiresIn=req.expires_in,
+            )
+            return {
+                "method": "PUT",
+                "url": url,
+                "headers": {"Content-Type": content_type, "x-amz-acl": "public-read"},
+                "skips_compression": policy_codec(bucket_name, content_type),
+            }
+
+        if req.method == "post":
+            conditions = [{"acl": "public-read"}, {"Content-Type": content_type}]
+            if req.max_size:
+                conditions.append(["content-length-range", 0, req.max_size])
+            post = s3_client.generate_presigned_post(
+                bucket_name,
+                req.key,
+                Fields={"acl": "public-read", "Content-Type": content_type},
+                Conditions=conditions,
+                ExpiresIn=req.expires_in,
+            )
+            return {"method": "POST", **post, "skips_compression": policy_codec(bucket_name, content_type)}
+
+        return {"detail": f"Unsupported method '{req.method}' (use get, put or post)"}
+    except Exception as e:
+        return {"detail": str(e)}
+
+
+@app.post("/bucket/{bucket_name}/presign/multipart")
+async def presign_multipart(bucket_name: str, req: PresignMultipartModel):
+    """Start a multipart upload and presign a PUT URL for every part.
+
+    The client uploads each part directly, keeps the ETag response header of
+    each, then calls /presign/multipart/complete. Like /presign, this bypasses
+    the bucket's compression policy and says so in "skips_compression".
+    """
+    if not 1 <= req.parts <= PRESIGN_MAX_PARTS:
+        return {"detail": f"parts must be between 1 and {PRESIGN_MAX_PARTS}"}
+    try:
+        content_type = _content_type(req.key, req.content_type)
+        upload_id = (await s3.create_multipart_upload(
+            Bucket=bucket_name,
+            Key=req.key,
+            ACL="public-read",
+            ContentType=content_type,
+        ))["UploadId"]
+
+        def sign_parts():
+            # Signing is local, but thousands of parts is real CPU; keep it off the loop
+            return [
+                {
+                    "part_number": number,
+                    "url": s3_client.generate_presigned_url(
+                        "upload_part",
+                        Params={"Bucket": bucket_name, "Key": req.key, "UploadId": upload_id, "PartNumber": number},
+                        ExpiresIn=req.expires_in,
+                    ),
+                }
+                for number in range(1, req.parts + 1)
+            ]
+
+        urls = await s3.run(sign_parts)
+        skipped = await asyncio.get_running_loop().run_in_executor(None, policy_codec, bucket_name, content_type)
+        return {"upload_id": upload_id, "parts": urls, "skips_compression": skipped}
+    except Exception as e:
+        return {"detail": str(e)}
+
+
+@app.post("/bucket/{bucket_name}/presign/multipart/complete")
+async def complete_multipart(bucket_name: str, req: CompleteMultipartModel):
+    """Finish a presigned multipart upload; parts are [{"PartNumber": n, "ETag": "..."}]."""
+    try:
+        parts = sorted(
+            ({"PartNumber": int(p["PartNumber"]), "ETag": p["ETag"]} for p in req.parts),
+            key=lambda p: p["PartNumber"],
+        )
+        await s3.complete_multipart_upload(
+            Bucket=bucket_name, Key=req.key, UploadId=req.upload_id, MultipartUpload={"Parts": parts},
+        )
+        await s3.run(index_refresh, bucket_name, req.key)
+        return {"message": f"File '{req.key}' uploaded successfully."}
+    except Exception as e:
+        return {"detail": str(e)}
+
+
+@app.post("/bucket/{bucket_name}/presign/multipart/abort")
+async def abort_multipart(bucket_name: str, req: CompleteMultipartModel):
+    try:
+        await s3.abort_multipart_upload(Bucket=bucket_name, Key=req.key, UploadId=req.upload_id)
+        return {"message": f"Upload of '{req.key}' aborted."}
     except Exception as e:
         return {"detail": str(e)}
 
@@ -151,12 +1627,405 @@ async def upload_file(bucket_name: str = Form(...), file: UploadFile = Form(...)
 # -------------------------------------------------
 # LIST FILES IN BUCKET
 # -------------------------------------------------
+def _object_entry(obj):
+    return {
+        "Key": obj["Key"],
+        "Size": obj["Size"],
+        "LastModified": obj["LastModified"].isoformat(),
+        "ETag": obj["ETag"].strip('"'),
+    }
+
+
 @app.get("/bucket/{bucket_name}/list")
-def list_files(bucket_name: str):
+async def list_files(
+    bucket_name: str,
+    prefix: str = "",
+    delimiter: Optional[str] = None,
+    start_after: Optional[str] = None,
+    continuation_token: Optional[str] = None,
+    page_size: int = Query(1000, ge=1, le=1000),
+    stream: bool = False,
+):
+    """One page of objects (and folders, with a delimiter) plus the token for the next page.
+
+    With stream=true every page is walked and each object/folder is sent as
+    one NDJSON line, ending with a summary line; memory stays at one page.
+    """
+    params = {"Bucket": bucket_name, "Prefix": prefix}
+    if delimiter:
+        params["Delimiter"] = delimiter
+    if start_after:
+        params["StartAfter"] = start_after
+    if continuation_token:
+        params["ContinuationToken"] = continuation_token
+
+    if stream:
+        async def lines():
+            objects = folders = 0
+            try:
+                while True:
+                    page = await s3.list_objects_v2(**params, MaxKeys=page_size)
+                    for folder in page.get("CommonPrefixes", []):
+                        folders += 1
+                        yield json.dumps({"Prefix": folder["Prefix"]}) + "\n"
+                    for obj in page.get("Contents", []):
+                        objects += 1
+                        yield json.dumps(_object_entry(obj)) + "\n"
+                    if not page.get("IsTruncated"):
+                        break
+                    params["ContinuationToken"] = page["NextContinuationToken"]
+                yield json.dumps({"summary": {"objects": objects, "folders": folders}}) + "\n"
+            except Exception as e:
+                yield json.dumps({"detail": str(e)}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    try:
+        resp = await s3.list_objects_v2(**params, MaxKeys=page_size)
+        return {
+            "files": [_object_entry(f) for f in resp.get("Contents", [])],
+            "folders": [p["Prefix"] for p in resp.get("CommonPrefixes", [])],
+            "is_truncated": resp.get("IsTruncated", False),
+            "next_continuation_token": resp.get("NextContinuationToken"),
+        }
+    except Exception as e:
+        return {"detail": str(e)}
+
+
+# -------------------------------------------------
+# SEARCH FILES (local index)
+# -------------------------------------------------
+INDEX_SORTS = {
+    "key": IndexedObject.key,
+    "size": IndexedObject.size,
+    "last_modified": IndexedObject.last_modified,
+}
+
+
+@app.get("/bucket/{bucket_name}/index")
+def search_index(
+    bucket_name: str,
+    q: Optional[str] = None,
+    prefix: Optional[str] = None,
+    sort: str = "key",
+    order: str = "asc",
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    count: bool = False,
+):
+    """Browse or search a bucket from the local index: prefix and substring match, sort by key/size/date."""
+    if sort not in INDEX_SORTS:
+        return {"detail": f"sort must be one of {', '.join(INDEX_SORTS)}"}
+    try:
+        conditions = [IndexedObject.bucket == bucket_name]
+        if prefix:
+            # A key range instead of LIKE, so the primary key index is used
+            conditions.append(IndexedObject.key >= prefix)
+            conditions.append(IndexedObject.key < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        if q:
+            conditions.append(IndexedObject.key.contains(q, autoescape=True))
+
+        column = INDEX_SORTS[sort]
+        ordering = [column.desc() if order == "desc" else column.asc()]
+        if sort != "key":
+            ordering.append(IndexedObject.key.asc())
+
+        with SessionLocal() as db:
+            rows = db.scalars(
+                select(IndexedObject).where(*conditions).order_by(*ordering).limit(limit).offset(offset)
+            ).all()
+            total = db.scalar(select(func.count()).select_from(IndexedObject).where(*conditions)) if count else None
+            indexed = db.get(IndexedBucket, bucket_name)
+
+        return {
+            "files": [
+                {
+                    "Key": r.key,
+                    "Size": r.size,
+                    "LastModified": r.last_modified.isoformat() if r.last_modified else None,
+                    "ETag": r.etag,
+                }
+                for r in rows
+            ],
+            "total": total,
+            "last_reconciled": indexed.last_reconciled.isoformat() if indexed and indexed.last_reconciled else None,
+        }
+    except Exception as e:
+        return {"detail": str(e)}
+
+
+@app.post("/bucket/{bucket_name}/index/refresh")
+async def refresh_index(bucket_name: str, key: str):
+    """Re-read one object into the index, e.g. after a presigned PUT that bypassed the backend."""
     try:
-        resp = s3_client.list_objects_v2(Bucket=bucket_name)
-        files = resp.get("Contents", [])
-        return {"files": [{"Key": f["Key"]} for f in files]}
+        await s3.run(index_refresh, bucket_name, key)
+        return {"message": f"Indexed '{key}'."}
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            await s3.run(index_remove, bucket_name, [key])
+            return {"message": f"'{key}' no longer exists; removed from index."}
+        return {"detail": str(e)}
+    except Exception as e:
+        return {"detail": str(e)}
+
+
+@app.post("/bucket/{bucket_name}/index/reconcile")
+async def reconcile_index(bucket_name: str):
+    """Queue a full paginated re-scan of the bucket into the local index."""
+    job = start_job("reconcile_index", _reconcile_job, bucket_name)
+    return {"status": job.status, "job_id": job.id}
+
+
+# -------------------------------------------------
+# BUCKET USAGE STATS
+# -------------------------------------------------
+# Upper bounds of the size histogram classes; the last class is open-ended
+SIZE_CLASSES = [
+    (1024, "<1KB"),
+    (64 * 1024, "1KB-64KB"),
+    (1024 ** 2, "64KB-1MB"),
+    (16 * 1024 ** 2, "1MB-16MB"),
+    (128 * 1024 ** 2, "16MB-128MB"),
+    (1024 ** 3, "128MB-1GB"),
+]
+SIZE_LABELS = [label for _, label in SIZE_CLASSES] + [">=1GB"]
+
+
+def _size_class(size):
+    for i, (limit, _) in enumerate(SIZE_CLASSES):
+        if size < limit:
+            return i
+    return len(SIZE_CLASSES)
+
+
+def _new_group():
+    return {"count": 0, "bytes": 0, "histogram": [0] * len(SIZE_LABELS)}
+
+
+class UsageStats:
+    """Count, bytes and size histogram for a bucket, by top-level prefix and by content type."""
+
+    def __init__(self):
+        self.total = _new_group()
+        self.by_prefix = {}
+        self.by_type = {}
+
+    def add(self, key, size, sign=1):
+        prefix = key.split("/", 1)[0] + "/" if "/" in key else ""
+        content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+        size_class = _size_class(size)
+        for groups, name in ((None, None), (self.by_prefix, prefix), (self.by_type, content_type)):
+            group = self.total if groups is None else groups.setdefault(name, _new_group())
+            group["count"] += sign
+            group["bytes"] += sign * size
+            group["histogram"][size_class] += sign
+            if groups is not None and group["count"] <= 0:
+                del groups[name]
+
+    def to_dict(self, top):
+        def render(group):
+            return {
+                "count": group["count"],
+                "bytes": group["bytes"],
+                "histogram": dict(zip(SIZE_LABELS, group["histogram"])),
+            }
+
+        def ranked(groups, label):
+            rows = sorted(groups.items(), key=lambda item: item[1]["bytes"], reverse=True)[:top]
+            return [{label: name, **render(group)} for name, group in rows]
+
+        return {
+            **render(self.total),
+            "by_prefix": ranked(self.by_prefix, "prefix"),
+            "by_content_type": ranked(self.by_type, "content_type"),
+        }
+
+
+class UsageCache:
+    """Per-bucket UsageStats, built by one streaming scan and then kept current
+    from upload/delete events (via the object index) until the TTL runs out.
+
+    Changes made while a scan is running are seen by the scan itself; the
+    rare one it misses is corrected by the next rescan. Until the bucket's
+    index has been reconciled once, a change to a key the index does not know
+    drops the entry, since that key's previous size is unknown.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._scans = {}
+        self._lock = threading.Lock()
+
+    def record(self, bucket_name, key, old_size, new_size):
+        """Apply one change; called from any thread. Sizes are None for absent objects."""
+        with self._lock:
+            entry = self._entries.get(bucket_name)
+            if entry is None:
+                return
+            if old_size is not None:
+                entry["stats"].add(key, old_size, -1)
+            if new_size is not None:
+                entry["stats"].add(key, new_size)
+            entry["events"] += 1
+
+    def drop(self, bucket_name):
+        with self._lock:
+            self._entries.pop(bucket_name, None)
+
+    def report(self, entry, top):
+        with self._lock:
+            return entry["stats"].to_dict(top)
+
+    async def get(self, bucket_name, refresh=False):
+        entry = self._entries.get(bucket_name)
+        if entry and not refresh and time.time() - entry["computed_at"] < S3_STATS_TTL_SECONDS:
+            return entry
+        # Concurrent requests for the same bucket share one scan
+        scan = self._scans.get(bucket_name)
+        if scan is None:
+            scan = asyncio.ensure_future(self._scan(bucket_name))
+            self._scans[bucket_name] = scan
+            scan.add_done_callback(lambda _: self._scans.pop(bucket_name, None))
+        return await asyncio.shield(scan)
+
+    async def _scan(self, bucket_name):
+        """One pass over the paginated listing; memory holds only the aggregates."""
+        start = time.perf_counter()
+        stats = UsageStats()
+        params = {"Bucket": bucket_name}
+        while True:
+            page = await s3.list_objects_v2(**params)
+            with self._lock:
+                for obj in page.get("Contents", []):
+                    stats.add(obj["Key"], obj["Size"])
+            if not page.get("IsTruncated"):
+                break
+            params["ContinuationToken"] = page["NextContinuationToken"]
+
+        entry = {
+            "stats": stats,
+            "computed_at": time.time(),
+            "scan_seconds": round(time.perf_counter() - start, 3),
+            "events": 0,
+        }
+        with self._lock:
+            self._entries[bucket_name] = entry
+        return entry
+
+
+usage_cache = UsageCache()
+
+
+@app.get("/bucket/{bucket_name}/stats")
+async def bucket_stats(bucket_name: str, refresh: bool = False, top: int = Query(20, ge=1, le=1000)):
+    """Object count, total bytes and size histograms, overall and by prefix / content type."""
+    try:
+        entry = await usage_cache.get(bucket_name, refresh)
+        return {
+            "bucket_name": bucket_name,
+            **usage_cache.report(entry, top),
+            "computed_at": datetime.fromtimestamp(entry["computed_at"], timezone.utc).isoformat(),
+            "scan_seconds": entry["scan_seconds"],
+            "events_applied": entry["events"],
+        }
+    except Exception as e:
+        return {"detail": str(e)}
+
+
+# -------------------------------------------------
+# SYNC (delta plan for a local directory)
+# -------------------------------------------------
+def _digest_rows(bucket_name, prefix):
+    """{key: (sha256, etag)} for every recorded digest under a prefix."""
+    conditions = [IndexedDigest.bucket == bucket_name]
+    if prefix:
+        conditions.append(IndexedDigest.key >= prefix)
+        conditions.append(IndexedDigest.key < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    with SessionLocal() as db:
+        return {
+            key: (sha256, etag)
+            for key, sha256, etag in db.execute(
+                select(IndexedDigest.key, IndexedDigest.sha256, IndexedDigest.etag).where(*conditions)
+            )
+        }
+
+
+@app.post("/bucket/{bucket_name}/sync/plan")
+async def sync_plan(bucket_name: str, req: SyncPlanModel):
+    """Diff a client manifest of (key, size, sha256) against the bucket.
+
+    Returns the keys to upload and, with delete, the keys under `prefix` that
+    are no longer in the manifest. An object counts as unchanged when its
+    recorded digest matches and its ETag has not moved since, or when a HEAD
+    shows the same sha256 metadata; nothing else is trusted.
+    """
+    try:
+        start = time.perf_counter()
+        remote = {}
+        params = {"Bucket": bucket_name, "Prefix": req.prefix}
+        while True:
+            page = await s3.list_objects_v2(**params)
+            for obj in page.get("Contents", []):
+                remote[obj["Key"]] = (obj["Size"], obj["ETag"].strip('"'))
+            if not page.get("IsTruncated"):
+                break
+            params["ContinuationToken"] = page["NextContinuationToken"]
+
+        digests = await asyncio.get_running_loop().run_in_executor(None, _digest_rows, bucket_name, req.prefix)
+
+        upload, unknown = [], []
+        unchanged = 0
+        for f in req.files:
+            sha256 = f.sha256.lower()
+            if f.key not in remote:
+                upload.append(f.key)
+                continue
+            size, etag = remote[f.key]
+            recorded = digests.get(f.key)
+            if recorded and recorded[1] == etag:
+                if recorded[0] == sha256:
+                    unchanged += 1
+                else:
+                    upload.append(f.key)
+            elif size != f.size:
+                upload.append(f.key)
+            else:
+                unknown.append((f.key, sha256, size))
+
+        # Same size but no usable digest: ask S3 for the sha256 metadata
+        slots = asyncio.Semaphore(S3_SYNC_HEAD_CONCURRENCY)
+
+        async def check(key, sha256, size):
+            async with slots:
+                try:
+                    head = await s3.head_object(Bucket=bucket_name, Key=key)
+                except ClientError:
+                    return False
+            if head.get("Metadata", {}).get("sha256") != sha256:
+                return False
+            await asyncio.get_running_loop().run_in_executor(
+                None, digest_put, bucket_name, key, sha256, head["ETag"], head["ContentLength"]
+            )
+            return True
+
+        results = await asyncio.gather(*(check(*u) for u in unknown))
+        for (key, _, _), same in zip(unknown, results):
+            if same:
+                unchanged += 1
+            else:
+                upload.append(key)
+
+        wanted = {f.key for f in req.files}
+        to_delete = sorted(k for k in remote if k not in wanted) if req.delete else []
+
+        return {
+            "upload": upload,
+            "delete": to_delete,
+            "unchanged": unchanged,
+            "remote_objects": len(remote),
+            "heads": len(unknown),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
     except Exception as e:
         return {"detail": str(e)}
 
@@ -164,17 +2033,302 @@ def list_files(bucket_name: str):
 # -------------------------------------------------
 # DELETE FILES
 # -------------------------------------------------
+async def bulk_delete(bucket_name, batches):
+    """Delete keys from an async iterator of key lists (each at most S3_DELETE_BATCH).
+
+    Up to S3_DELETE_CONCURRENCY delete_objects calls run at once; reading the
+    next batch waits for a free slot. Quiet mode makes S3 return only the
+    failures, so everything else in a batch counts as deleted. If reading the
+    batches fails partway, the batches already sent still finish and the
+    partial counts come back with a "detail".
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(S3_DELETE_CONCURRENCY)
+    tasks = []
+    deleted = 0
+    errors = []
+
+    async def send(keys):
+        nonlocal deleted
+        try:
+            resp = await s3.delete_objects(
+                Bucket=bucket_name,
+                Delete={"Objects": [{"Key": k} for k in keys], "Quiet": True},
+            )
+            failed = {e["Key"]: e for e in resp.get("Errors", [])}
+        except Exception as e:
+            # The whole call failed; report it against every key in the batch
+            failed = {k: {"Key": k, "Code": type(e).__name__, "Message": str(e)} for k in keys}
+        finally:
+            slots.release()
+
+        errors.extend(
+            {"key": k, "code": e.get("Code"), "message": e.get("Message")} for k, e in failed.items()
+        )
+        done = [k for k in keys if k not in failed]
+        deleted += len(done)
+        if done:
+            await loop.run_in_executor(None, index_remove, bucket_name, done)
+
+    start = time.perf_counter()
+    aborted = None
+    try:
+        async for keys in batches:
+            if keys:
+                await slots.acquire()
+                tasks.append(asyncio.create_task(send(keys)))
+    except Exception as e:
+        aborted = e
+    finally:
+        await asyncio.gather(*tasks)
+
+    result = {
+        "deleted": deleted,
+        "failed": len(errors),
+        "batches": len(tasks),
+        "seconds": round(time.perf_counter() - start, 3),
+        "errors": errors,
+    }
+    if aborted is not None:
+        result["detail"] = f"Stopped after {len(tasks)} batches: {aborted}"
+    return result
+
+
+async def _batched(keys):
+    """Group an iterable of keys into delete_objects-sized lists."""
+    batch = []
+    for key in keys:
+        batch.append(key)
+        if len(batch) == S3_DELETE_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _prefix_batches(bucket_name, prefix):
+    """Yield each listing page under a prefix as one batch; deletes overlap with listing."""
+    params = {"Bucket": bucket_name, "Prefix": prefix, "MaxKeys": S3_DELETE_BATCH}
+    while True:
+        resp = await s3.list_objects_v2(**params)
+        yield [obj["Key"] for obj in resp.get("Contents", [])]
+        if not resp.get("IsTruncated"):
+            return
+        params["ContinuationToken"] = resp["NextContinuationToken"]
+
+
+async def _ndjson_batches(body):
+    """Yield key batches from an NDJSON body (a JSON string or {"key": ...} per line) as it arrives."""
+    buffer = b""
+    batch = []
+    async for chunk in body:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                item = json.loads(line)
+                batch.append(item["key"] if isinstance(item, dict) else item)
+                if len(batch) == S3_DELETE_BATCH:
+                    yield batch
+                    batch = []
+    if buffer.strip():
+        item = json.loads(buffer)
+        batch.append(item["key"] if isinstance(item, dict) else item)
+    if batch:
+        yield batch
+
+
+def _checked_prefix(prefix, delete_all):
+    if not prefix and not delete_all:
+        raise HTTPException(
+            status_code=400, detail="An empty prefix deletes the whole bucket; pass all=true to confirm"
+        )
+    return prefix
+
+
+@app.post("/bucket/{bucket_name}/delete")
+async def bulk_delete_files(
+    bucket_name: str, request: Request, prefix: Optional[str] = None,
+    delete_all: bool = Query(False, alias="all"),
+):
+    """Delete many objects: a JSON body ({"keys": [...]} or {"prefix": "..."}), an
+    NDJSON body with one key per line, or ?prefix= to delete everything under it.
+    An empty prefix (the whole bucket) also needs all=true.
+
+    Returns counts plus a per-key list of failures.
+    """
+    try:
+        content_type = request.headers.get("content-type", "")
+        if prefix is not None:
+            batches = _prefix_batches(bucket_name, _checked_prefix(prefix, delete_all))
+        elif "ndjson" in content_type:
+            batches = _ndjson_batches(request.stream())
+        else:
+            payload = await request.json()
+            if isinstance(payload, list):
+                payload = {"keys": payload}
+            if payload.get("prefix") is not None:
+                prefix = _checked_prefix(payload["prefix"], delete_all or payload.get("all"))
+                batches = _prefix_batches(bucket_name, prefix)
+            elif payload.get("keys"):
+                batches = _batched(payload["keys"])
+            else:
+                raise HTTPException(status_code=400, detail="Provide keys, a prefix, or an NDJSON body")
+        return await bulk_delete(bucket_name, batches)
+    except HTTPException:
+        raise
+    except Exception as e:
+        return {"detail": str(e)}
+
+
 @app.delete("/bucket/{bucket_name}/delete")
-def delete_files(bucket_name: str, keys: str = Query(...)):
+async def delete_files(bucket_name: str, keys: str = Query(...)):
+    """Comma-separated keys; kept for old clients. Prefer POST /bucket/{bucket_name}/delete."""
     try:
-        key_list = keys.split(",")
-        objects = [{"Key": key} for key in key_list]
-        s3_client.delete_objects(Bucket=bucket_name, Delete={"Objects": objects})
-        return {"message": f"Deleted {len(key_list)} files successfully."}
+        result = await bulk_delete(bucket_name, _batched(keys.split(",")))
+        if result["failed"]:
+            return {"detail": f"Failed to delete {result['failed']} files.", **result}
+        return {"message": f"Deleted {result['deleted']} files successfully."}
     except Exception as e:
         return {"detail": str(e)}
 
 
+# -------------------------------------------------
+# DOWNLOAD (streaming proxy)
+# -------------------------------------------------
+def _object_headers(resp, download_name=None, decoded=False):
+    headers = {
+        "ETag": resp["ETag"],
+        "Last-Modified": format_datetime(resp["LastModified"], usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+    if resp.get("ContentEncoding"):
+        headers["Vary"] = "Accept-Encoding"
+        if decoded:
+            # Different bytes than S3 stores: weak ETag, length unknown, no ranges
+            headers["ETag"] = "W/" + resp["ETag"]
+            headers["Accept-Ranges"] = "none"
+            resp = {k: v for k, v in resp.items() if k not in ("ContentLength", "ContentRange")}
+        else:
+            headers["Content-Encoding"] = resp["ContentEncoding"]
+    if "ContentLength" in resp:
+        headers["Content-Length"] = str(resp["ContentLength"])
+    if resp.get("ContentRange"):
+        headers["Content-Range"] = resp["ContentRange"]
+    if download_name:
+        headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+    return headers
+
+
+def _s3_http_error(e):
+    """An HTTP error for a failed S3 call: S3's own 4xx/5xx status, 502 otherwise.
+
+    Downloads must not answer 200 with a JSON body, or browsers save it as the file.
+    """
+    status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 502
+    return HTTPException(status_code=status if status >= 400 else 502, detail=str(e))
+
+
+@app.get("/bucket/{bucket_name}/object/{key:path}")
+async def get_object(
+    bucket_name: str,
+    key: str,
+    download: bool = False,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
+    """Stream an object through the backend in constant memory.
+
+    Range requests get a 206 (resumable downloads), a matching If-None-Match
+    gets a 304, and an If-Range ETag that no longer matches falls back to the
+    whole object (If-Range may be an ETag or an HTTP date; an unparseable one
+    drops the Range). Compressed objects are sent encoded to clients that accept
+    the encoding and decoded on the fly (whole object, no ranges) otherwise.
+    """
+    params = {"Bucket": bucket_name, "Key": key}
+    if if_none_match:
+        params["IfNoneMatch"] = if_none_match
+    if range_header:
+        params["Range"] = range_header
+        if if_range and if_range.startswith(("\"", "W/")):
+            params["IfMatch"] = if_range
+        elif if_range:
+            try:
+                params["IfUnmodifiedSince"] = parsedate_to_datetime(if_range)
+            except (TypeError, ValueError):
+                # RFC 9110: an If-Range that cannot be evaluated means no Range
+                params.pop("Range")
+
+    try:
+        try:
+            resp = await s3.get_object(**params)
+        except ClientError as e:
+            if_range_keys = [k for k in ("IfMatch", "IfUnmodifiedSince") if k in params]
+            if e.response["Error"]["Code"] not in ("412", "PreconditionFailed") or not if_range_keys:
+                raise
+            # If-Range mismatch: the object changed, so send all of it
+            params.pop("Range")
+            for k in if_range_keys:
+                params.pop(k)
+            resp = await s3.get_object(**params)
+    except ClientError as e:
+        code = e.response["Error"]["Code"]
+        headers = e.response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+        if code in ("304", "NotModified"):
+            return Response(status_code=304, headers={"ETag": headers.get("etag", if_none_match)})
+        if code in ("NoSuchKey", "404"):
+            raise HTTPException(status_code=404, detail=f"'{key}' not found in '{bucket_name}'")
+        if code == "InvalidRange":
+            size = e.response["Error"].get("ActualObjectSize", "*")
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        raise _s3_http_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    encoding = resp.get("ContentEncoding")
+    decode = (
+        encoding in ("gzip", "zstd")
+        and encoding not in (accept_encoding or "")
+        and (encoding == "gzip" or zstandard is not None)
+    )
+    if decode and resp.get("ContentRange"):
+        # A range of the stored bytes is not a range of the content; send it all
+        resp["Body"].close()
+        params.pop("Range", None)
+        params.pop("IfMatch", None)
+        params.pop("IfUnmodifiedSince", None)
+        try:
+            resp = await s3.get_object(**params)
+        except ClientError as e:
+            raise _s3_http_error(e)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=str(e))
+
+    body = resp["Body"]
+
+    async def chunks():
+        decompressor = _decompressor(encoding) if decode else None
+        try:
+            while True:
+                chunk = await s3.run(body.read, S3_DOWNLOAD_CHUNK_KB * 1024)
+                if not chunk:
+                    break
+                yield decompressor.decompress(chunk) if decompressor else chunk
+            if decompressor and hasattr(decompressor, "flush"):
+                yield decompressor.flush()
+        finally:
+            body.close()
+
+    return StreamingResponse(
+        chunks(),
+        status_code=206 if resp.get("ContentRange") else 200,
+        media_type=resp.get("ContentType") or _content_type(key),
+        headers=_object_headers(resp, key.rsplit("/", 1)[-1] if download else None, decoded=decode),
+    )
+
+
 # -------------------------------------------------
 # GET PUBLIC URL
 # -------------------------------------------------
@@ -190,27 +2344,65 @@ def get_public_url(bucket_name: str, key: str):
 # -------------------------------------------------
 # DELETE BUCKET
 # -------------------------------------------------
+async def _delete_bucket(job, bucket_name):
+    path = workspace_dir(bucket_name)
+    loop = asyncio.get_running_loop()
+    async with dir_lock(path):
+        if os.path.exists(os.path.join(path, "terraform.tfstate")):
+            # The workspace only holds this bucket, so a full destroy targets exactly it
+            await terraform_init(job, cwd=path)
+            await terraform(job, "destroy", "-auto-approve", cwd=path)
+            engine = "Terraform destroy"
+        elif not os.path.exists(os.path.join(path, "imports.tf")):
+            # No state and no boto3 marker: a failed create, or a bucket this
+            # backend never made. Clear the leftover workspace, touch nothing in S3.
+            shutil.rmtree(path, ignore_errors=True)
+            forget_dir_lock(path)
+            raise RuntimeError(f"Bucket '{bucket_name}' was not created by this backend; nothing deleted")
+        else:
+            # Created with boto3 and never adopted: nothing in state, so delete directly
+            result = await bulk_delete(bucket_name, _prefix_batches(bucket_name, ""))
+            job.log.append(f"Emptied bucket: {result['deleted']} objects deleted")
+            if result["failed"]:
+                raise RuntimeError(f"Could not empty bucket: {result['errors'][:5]}")
+            await s3.delete_bucket(Bucket=bucket_name)
+            engine = "boto3"
+        shutil.rmtree(path, ignore_errors=True)
+    forget_dir_lock(path)
+    await loop.run_in_executor(None, index_drop_bucket, bucket_name)
+
+    return {
+        "message": f"S3 bucket '{bucket_name}' destroyed successfully via {engine}."
+    }
+
+
 @app.delete("/bucket/{bucket_name}")
-def delete_bucket(bucket_name: str):
-    try:
-        # Sanitize bucket name (Terraform resource labels cannot contain '-')
-        resource_name = bucket_name.replace("-", "_")
+async def delete_bucket(bucket_name: str):
+    """Queue bucket destroy; follow /jobs/{job_id}/stream for Terraform output."""
+    if not os.path.isdir(workspace_dir(bucket_name)):
+        raise HTTPException(status_code=404, detail=f"No Terraform workspace for bucket '{bucket_name}'")
+    job = start_job("delete_bucket", _delete_bucket, bucket_name)
+    return {"status": job.status, "job_id": job.id}
 
-        # Run targeted Terraform destroy
-        subprocess.run(
-            ["terraform", "init", "-input=false"], cwd=TF_DIR, check=True
-          )
-        subprocess.run(
-            [ "terraform", "destroy", f"-target=aws_s3_bucket.files_bucket", "-auto-approve",], cwd=TF_DIR, check=True,
-            )
 
-        return {
-            "message": f"S3 bucket '{bucket_name}' destroyed successfully via targeted Terraform destroy."
-        }
-    except subprocess.CalledProcessError as e:
-        return {"detail": f"Terraform error: {e}"}
-    except Exception as e:
-        return {"detail": str(e)}
+# -------------------------------------------------
+# SETTINGS
+# -------------------------------------------------
+@app.get("/settings/transfer")
+def transfer_settings():
+    return {
+        "multipart_threshold_mb": S3_MULTIPART_THRESHOLD_MB,
+        "multipart_chunksize_mb": S3_MULTIPART_CHUNKSIZE_MB,
+        "max_concurrency": S3_MAX_CONCURRENCY,
+        "transfer_workers": S3_TRANSFER_WORKERS,
+        "stream_part_mb": S3_STREAM_PART_MB,
+        "stream_max_inflight_parts": S3_STREAM_MAX_INFLIGHT,
+        "provision_engine": S3_PROVISION_ENGINE,
+        "api_workers": S3_API_WORKERS,
+        "max_pool_connections": S3_MAX_POOL_CONNECTIONS,
+        "retry_mode": "adaptive",
+        "max_attempts": S3_MAX_ATTEMPTS,
+    }
 
 
 # -------------------------------------------------
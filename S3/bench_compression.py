@@ -0,0 +1,130 @@
+import argparse
+import json
+import mimetypes
+import os
+import random
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# =========================
+# CONFIGURATION
+# =========================
+# Same levels as backend_s3.py, so the numbers match what uploads will get
+GZIP_LEVEL = int(os.getenv("S3_GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("S3_ZSTD_LEVEL", "3"))
+CHUNK = 1024 * 1024
+
+# Match the backend's extra mime types
+mimetypes.add_type("text/plain", ".log")
+mimetypes.add_type("application/x-ndjson", ".ndjson")
+
+
+# =========================
+# SAMPLE DATA
+# =========================
+def synthetic_samples(size):
+    """Representative payloads when no files are given (name -> bytes)."""
+    rng = random.Random(42)
+    words = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india"]
+    levels = ["INFO", "WARN", "ERROR", "DEBUG"]
+
+    def fill(make_line):
+        out = bytearray()
+        while len(out) < size:
+            out += make_line().encode()
+        return bytes(out[:size])
+
+    return {
+        "sample.txt": fill(lambda: " ".join(rng.choice(words) for _ in range(12)) + "\n"),
+        "sample.csv": fill(lambda: f"{rng.randint(1, 10**6)},{rng.choice(words)},{rng.random():.6f},{rng.choice(levels)}\n"),
+        "sample.json": fill(lambda: json.dumps({
+            "id": rng.randint(1, 10**6), "name": rng.choice(words), "score": rng.random(), "tags": rng.sample(words, 3),
+        }) + "\n"),
+        "sample.log": fill(lambda: f"2025-01-01T00:00:{rng.randint(0, 59):02d}Z [{rng.choice(levels)}] request {rng.randint(1, 9999)} done in {rng.randint(1, 900)}ms\n"),
+        "sample.bin": rng.randbytes(size),
+    }
+
+
+# =========================
+# CODECS
+# =========================
+def gzip_codec():
+    return (
+        lambda: zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31),
+        lambda: zlib.decompressobj(31),
+    )
+
+
+def zstd_codec():
+    return (
+        lambda: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj(),
+        lambda: zstandard.ZstdDecompressor().decompressobj(),
+    )
+
+
+def run(data, codec):
+    """Compress and decompress in CHUNK-sized pieces, as the backend streams them."""
+    make_compressor, make_decompressor = codec
+
+    start = time.perf_counter()
+    compressor = make_compressor()
+    parts = [compressor.compress(data[i:i + CHUNK]) for i in range(0, len(data), CHUNK)]
+    parts.append(compressor.flush())
+    compress_seconds = time.perf_counter() - start
+    compressed = b"".join(parts)
+
+    start = time.perf_counter()
+    decompressor = make_decompressor()
+    restored = b"".join(decompressor.decompress(compressed[i:i + CHUNK]) for i in range(0, len(compressed), CHUNK))
+    decompress_seconds = time.perf_counter() - start
+    assert restored == data, "round trip mismatch"
+
+    mb = len(data) / (1024 * 1024)
+    return {
+        "ratio": len(data) / max(1, len(compressed)),
+        "compress_mb_s": mb / max(compress_seconds, 1e-9),
+        "decompress_mb_s": mb / max(decompress_seconds, 1e-9),
+    }
+
+
+# =========================
+# MAIN
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="Compression ratio and throughput per content type")
+    parser.add_argument("files", nargs="*", help="files to measure (default: synthetic samples)")
+    parser.add_argument("--size-mb", type=int, default=16, help="size of each synthetic sample")
+    args = parser.parse_args()
+
+    if args.files:
+        samples = {}
+        for path in args.files:
+            with open(path, "rb") as f:
+                samples[os.path.basename(path)] = f.read()
+    else:
+        samples = synthetic_samples(args.size_mb * 1024 * 1024)
+
+    codecs = {f"gzip-{GZIP_LEVEL}": gzip_codec()}
+    if zstandard is not None:
+        codecs[f"zstd-{ZSTD_LEVEL}"] = zstd_codec()
+    else:
+        print("[WARN] zstandard is not installed; only gzip is measured")
+
+    print(f"{'file':<24}{'content type':<28}{'codec':<10}{'ratio':>8}{'comp MB/s':>12}{'decomp MB/s':>13}")
+    for name, data in samples.items():
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        for codec_name, codec in codecs.items():
+            r = run(data, codec)
+            print(
+                f"{name:<24}{content_type:<28}{codec_name:<10}"
+                f"{r['ratio']:>8.2f}{r['compress_mb_s']:>12.1f}{r['decompress_mb_s']:>13.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
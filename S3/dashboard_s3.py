@@ -1,11 +1,18 @@
 
 import streamlit as st
 import requests
-from io import BytesIO
+import hashlib
+import os
+import sys
 from urllib.parse import quote 
 
+# Job streaming helper shared with the EC2 dashboard (common/ at the repo root)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.dashboard_jobs import follow_job
+
 # FastAPI backend URL
-BASE_URL = "http://127.0.0.1:8003/bucket"
+JOBS_URL = "http://127.0.0.1:8003"
+BASE_URL = f"{JOBS_URL}/bucket"
 
 st.set_page_config(page_title="🪣 S3 Bucket Management Panel")
 
@@ -16,16 +23,26 @@ st.title("🪣 S3 Bucket Management Panel")
 # =========================================================
 st.header("Create a New Bucket")
 bucket_name = st.text_input("Enter new bucket name")
+engine = st.radio(
+    "Provisioning engine",
+    ["terraform", "boto3"],
+    horizontal=True,
+    help="boto3 creates the bucket in about a second; Terraform can adopt it later.",
+)
 
 if st.button("Create Bucket"):
     if bucket_name:
         try:
             response = requests.post(
                 f"{BASE_URL}/create",
-                data={"bucket_name": bucket_name}
+                data={"bucket_name": bucket_name, "engine": engine}
             )
             if response.status_code == 200:
-                st.success(f"✅ Bucket created successfully.")
+                job = follow_job(JOBS_URL, response.json()["job_id"])
+                if job["status"] == "succeeded":
+                    st.success(f"✅ Bucket created successfully.")
+                else:
+                    st.error(f"❌ Bucket creation failed.\n\n{job['error']}")
             else:
                 st.error(f"❌ Backend rejected request ({response.status_code}).\n\n{response.text}")
         except Exception as e:
@@ -42,25 +59,105 @@ st.header("Upload a File to S3 Bucket")
 upload_bucket = st.text_input("Enter target bucket name")
 upload_file = st.file_uploader("Choose a file")
 
+skip_duplicates = st.checkbox("Skip files already stored (dedup)")
+
 if st.button("Upload File"):
-    if upload_bucket and upload_file:
+    if upload_bucket and upload_file and skip_duplicates:
+        try:
+            # Hash locally first: if S3 already has the content, nothing is sent
+            digest = hashlib.sha256(upload_file.getvalue()).hexdigest()
+            upload_file.seek(0)
+            response = requests.put(
+                f"{BASE_URL}/{upload_bucket}/stream/{quote(upload_file.name)}",
+                params={"dedup": "true"},
+                data=upload_file,
+                headers={"Content-Type": upload_file.type or "application/octet-stream", "X-Content-SHA256": digest},
+            )
+            result = response.json()
+            if response.status_code == 200 and "detail" not in result:
+                if result["dedup"] == "uploaded":
+                    st.success(f"✅ File uploaded successfully.")
+                else:
+                    st.success(f"✅ Already stored; upload {result['dedup']} ({result['bytes_saved']:,} bytes saved).")
+            else:
+                st.error(f"❌ Upload failed ({response.status_code}).\n\n{response.text}")
+        except Exception as e:
+            st.error(f"⚠️ Error: {str(e)}")
+    elif upload_bucket and upload_file:
         try:
-            files = {"file": (upload_file.name, upload_file.getvalue())}
-            data = {"bucket_name": upload_bucket}
+            # The backend only presigns; the file goes straight to S3
+            response = requests.post(
+                f"{BASE_URL}/{upload_bucket}/presign",
+                json={"key": upload_file.name, "method": "put", "content_type": upload_file.type},
+            )
+            signed = response.json()
+            if response.status_code != 200 or "url" not in signed:
+                st.error(f"❌ Could not get upload URL ({response.status_code}).\n\n{response.text}")
+            elif signed.get("skips_compression"):
+                # The bucket compresses this type, which a direct upload would skip; go through the backend
+                upload_file.seek(0)
+                response = requests.put(
+                    f"{BASE_URL}/{upload_bucket}/stream/{quote(upload_file.name)}",
+                    data=upload_file,
+                    headers={"Content-Type": upload_file.type or "application/octet-stream"},
+                )
+                if response.status_code == 200 and "detail" not in response.json():
+                    st.success(f"✅ File uploaded successfully ({signed['skips_compression']}-compressed).")
+                else:
+                    st.error(f"❌ Upload failed ({response.status_code}).\n\n{response.text}")
+            else:
+                upload_file.seek(0)
+                response = requests.put(signed["url"], data=upload_file, headers=signed["headers"])
+                if response.status_code == 200:
+                    # The upload bypassed the backend, so tell the search index about it
+                    requests.post(f"{BASE_URL}/{upload_bucket}/index/refresh", params={"key": upload_file.name})
+                    st.success(f"✅ File uploaded successfully.")
+                else:
+                    st.error(f"❌ Upload failed ({response.status_code}).\n\n{response.text}")
+        except Exception as e:
+            st.error(f"⚠️ Error: {str(e)}")
+    else:
+        st.warning("Please provide both a bucket name and a file.")
+
+st.divider()
 
+# =========================================================
+# UPLOAD ARCHIVE (expanded server-side)
+# =========================================================
+st.header("Upload an Archive of Files")
+archive_bucket = st.text_input("Enter target bucket name for the archive")
+archive_prefix = st.text_input("Key prefix (optional)", placeholder="e.g., datasets/run1/")
+archive_file = st.file_uploader("Choose a .zip, .tar or .tar.gz", type=["zip", "tar", "gz", "tgz", "bz2", "xz"])
+
+if st.button("Upload and Expand"):
+    if archive_bucket and archive_file:
+        try:
+            archive_file.seek(0)
             response = requests.post(
-                f"{BASE_URL}/upload",
-                data=data,
-                files=files
+                f"{BASE_URL}/{archive_bucket}/expand",
+                params={"prefix": archive_prefix},
+                data=archive_file,
+                headers={"Content-Type": "application/octet-stream"},
             )
-            if response.status_code == 200:
-                st.success(f"✅ File uploaded successfully.")
+            data = response.json()
+            if response.status_code == 200 and "detail" not in data:
+                st.success(
+                    f"✅ {data['uploaded']} of {data['entries']} files uploaded "
+                    f"({data['bytes']:,} bytes in {data['seconds']}s)."
+                )
+                if data["error"]:
+                    st.error(f"❌ Archive stopped early: {data['error']}")
+                failed = [e for e in data["manifest"] if e["status"] == "failed"]
+                if failed:
+                    st.warning(f"⚠️ {len(failed)} files failed:")
+                    for e in failed:
+                        st.write(f"- {e['key']}: {e['error']}")
             else:
                 st.error(f"❌ Upload failed ({response.status_code}).\n\n{response.text}")
         except Exception as e:
             st.error(f"⚠️ Error: {str(e)}")
     else:
-        st.warning("Please provide both a bucket name and a file.")
+        st.warning("Please provide both a bucket name and an archive.")
 
 st.divider()
 
@@ -69,23 +166,141 @@ st.divider()
 # =========================================================
 st.header("List Files in a Bucket")
 list_bucket = st.text_input("Enter bucket name to list files")
+list_prefix = st.text_input("Prefix (optional)", placeholder="e.g., reports/2024/")
+folder_view = st.checkbox("Folder view", value=True)
+LIST_PAGE_SIZE = 100
+
+
+def show_page(params):
+    """Fetch one listing page; the result stays in session state across reruns."""
+    st.session_state["list_page"] = {"params": params, "response": None}
+    try:
+        response = requests.get(f"{BASE_URL}/{params['bucket']}/list", params={
+            k: v for k, v in params.items() if k != "bucket" and v is not None
+        })
+        st.session_state["list_page"]["response"] = (response.status_code, response.json(), response.text)
+    except Exception as e:
+        st.session_state["list_page"]["response"] = (None, None, str(e))
+
 
 if st.button("List Files"):
     if list_bucket:
-        try:
-            response = requests.get(f"{BASE_URL}/{list_bucket}/list")
+        show_page({
+            "bucket": list_bucket,
+            "prefix": list_prefix,
+            "delimiter": "/" if folder_view else None,
+            "page_size": LIST_PAGE_SIZE,
+        })
+    else:
+        st.warning("Please enter a bucket name.")
 
-            if response.status_code == 200:
-                data = response.json()
-                files = data.get("files", [])
-                if files:
-                    st.success(f"✅ Found {len(files)} files in '{list_bucket}'")
-                    for f in files:
-                        st.write(f"- {f['Key']}")
+page = st.session_state.get("list_page")
+if page and page["response"]:
+    status, data, text = page["response"]
+    if status is None:
+        st.error(f"⚠️ Error: {text}")
+    elif status == 200 and "detail" not in data:
+        files = data.get("files", [])
+        folders = data.get("folders", [])
+        if files or folders:
+            st.success(f"✅ Showing {len(folders)} folders and {len(files)} files in '{page['params']['bucket']}'")
+            for p in folders:
+                st.write(f"- 📁 {p}")
+            for f in files:
+                st.write(f"- {f['Key']} ({f['Size']:,} bytes)")
+        else:
+            st.info("📭 No files found in this bucket.")
+        if data.get("next_continuation_token"):
+            st.button(
+                "Next Page ➡️",
+                on_click=show_page,
+                args=({**page["params"], "continuation_token": data["next_continuation_token"]},),
+            )
+    else:
+        st.error(f"❌ Failed to list files ({status}).\n\n{text}")
+
+st.divider()
+
+# =========================================================
+# SEARCH FILES (local index)
+# =========================================================
+st.header("Search Files in a Bucket")
+search_bucket = st.text_input("Enter bucket name to search")
+search_text = st.text_input("Key contains", placeholder="e.g., invoice")
+sort_col, order_col = st.columns(2)
+with sort_col:
+    search_sort = st.selectbox("Sort by", ["key", "size", "last_modified"])
+with order_col:
+    search_order = st.selectbox("Order", ["asc", "desc"])
+
+search_c1, search_c2 = st.columns(2)
+with search_c1:
+    run_search = st.button("Search")
+with search_c2:
+    run_reconcile = st.button("🔄 Re-index Bucket")
+
+if run_search:
+    if search_bucket:
+        try:
+            response = requests.get(f"{BASE_URL}/{search_bucket}/index", params={
+                "q": search_text or None, "sort": search_sort, "order": search_order, "count": True,
+            })
+            data = response.json()
+            if response.status_code == 200 and "detail" not in data:
+                if data["files"]:
+                    st.success(f"✅ {data['total']} matching files (index reconciled {data['last_reconciled'] or 'never'})")
+                    for f in data["files"]:
+                        st.write(f"- {f['Key']} ({f['Size']:,} bytes, {f['LastModified']})")
                 else:
-                    st.info("📭 No files found in this bucket.")
+                    st.info("📭 No matching files in the index. Try re-indexing the bucket.")
+            else:
+                st.error(f"❌ Search failed ({response.status_code}).\n\n{response.text}")
+        except Exception as e:
+            st.error(f"⚠️ Error: {str(e)}")
+    else:
+        st.warning("Please enter a bucket name.")
+
+if run_reconcile:
+    if search_bucket:
+        try:
+            response = requests.post(f"{BASE_URL}/{search_bucket}/index/reconcile")
+            job = follow_job(JOBS_URL, response.json()["job_id"])
+            if job["status"] == "succeeded":
+                st.success(f"✅ Indexed {job['result']['objects']} objects ({job['result']['removed']} stale entries removed).")
+            else:
+                st.error(f"❌ Re-index failed.\n\n{job['error']}")
+        except Exception as e:
+            st.error(f"⚠️ Error: {str(e)}")
+    else:
+        st.warning("Please enter a bucket name.")
+
+st.divider()
+
+# =========================================================
+# BUCKET USAGE
+# =========================================================
+st.header("Bucket Usage")
+stats_bucket = st.text_input("Enter bucket name for usage stats")
+rescan = st.checkbox("Force a full rescan")
+
+if st.button("Show Usage"):
+    if stats_bucket:
+        try:
+            response = requests.get(f"{BASE_URL}/{stats_bucket}/stats", params={"refresh": rescan})
+            data = response.json()
+            if response.status_code == 200 and "detail" not in data:
+                c1, c2 = st.columns(2)
+                c1.metric("Objects", f"{data['count']:,}")
+                c2.metric("Total size", f"{data['bytes'] / (1024 * 1024):,.1f} MiB")
+                st.caption(f"Computed {data['computed_at']} (scan {data['scan_seconds']}s, {data['events_applied']} updates since)")
+                st.subheader("Size distribution")
+                st.bar_chart(data["histogram"])
+                st.subheader("By prefix")
+                st.table([{"prefix": r["prefix"] or "(root)", "objects": r["count"], "bytes": r["bytes"]} for r in data["by_prefix"]])
+                st.subheader("By content type")
+                st.table([{"content type": r["content_type"], "objects": r["count"], "bytes": r["bytes"]} for r in data["by_content_type"]])
             else:
-                st.error(f"❌ Failed to list files ({response.status_code}).\n\n{response.text}")
+                st.error(f"❌ Failed to get stats ({response.status_code}).\n\n{response.text}")
         except Exception as e:
             st.error(f"⚠️ Error: {str(e)}")
     else:
@@ -107,23 +322,21 @@ with col1:
     if st.button("📥 Fetch File for Download"):
         if op_bucket and op_file:
             try:
-                # Get public S3 URL from backend
-                response = requests.get(f"{BASE_URL}/{op_bucket}/url", params={"key": op_file})
+                # Presigned GET: the browser downloads straight from S3
+                response = requests.post(
+                    f"{BASE_URL}/{op_bucket}/presign",
+                    json={"key": op_file, "method": "get", "download": True},
+                )
+                url = response.json().get("url") if response.status_code == 200 else None
 
-                if response.status_code == 200:
-                    url = response.json().get("url")
-                    file_response = requests.get(url)
-
-                    if file_response.status_code == 200:
-                        st.download_button(
-                            label="⬇️ Click to Download File",
-                            data=BytesIO(file_response.content),
-                            file_name=op_file,
-                            mime=file_response.headers.get("Content-Type", "application/octet-stream")
-                        )
-                        st.success(f"✅ Ready to download: {op_file}")
-                    else:
-                        st.error("❌ File not accessible from S3 public URL.")
+                if url:
+                    st.link_button("⬇️ Click to Download File", url)
+                    # Streamed through the backend; resumable, works without S3 access from the browser
+                    st.link_button(
+                        "⬇️ Download via Backend",
+                        f"{BASE_URL}/{op_bucket}/object/{quote(op_file)}?download=true",
+                    )
+                    st.success(f"✅ Ready to download: {op_file}")
                 else:
                     st.error(f"⚠️ Failed to get URL: {response.text}")
 
@@ -160,11 +373,11 @@ with col3:
     if st.button("🗑️ Delete File"):
         if op_bucket and op_file:
             try:
-                response = requests.delete(
+                response = requests.post(
                     f"{BASE_URL}/{op_bucket}/delete",
-                    params={"keys": op_file}
+                    json={"keys": [op_file]}
                 )
-                if response.status_code == 200:
+                if response.status_code == 200 and not response.json().get("failed"):
                     st.success(f"✅ File deleted successfully.")
                 else:
                     st.error(f"❌ Deletion failed ({response.status_code}).\n\n{response.text}")
@@ -186,7 +399,11 @@ if st.button("Delete Bucket"):
         try:
             response = requests.delete(f"{BASE_URL}/{delete_bucket}")
             if response.status_code == 200:
-                st.success(f"✅ Bucket deleted successfully.")
+                job = follow_job(JOBS_URL, response.json()["job_id"])
+                if job["status"] == "succeeded":
+                    st.success(f"✅ Bucket deleted successfully.")
+                else:
+                    st.error(f"❌ Bucket deletion failed.\n\n{job['error']}")
             else:
                 st.error(f"❌ Backend rejected request ({response.status_code}).\n\n{response.text}")
         except Exception as e:
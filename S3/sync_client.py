@@ -0,0 +1,194 @@
+import argparse
+import fnmatch
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote
+
+import requests
+
+# =========================
+# CONFIGURATION
+# =========================
+SERVER_URL = os.getenv("S3_BACKEND_URL", "http://127.0.0.1:8003")
+# Local cache of (size, mtime) -> sha256, so unchanged files are not re-hashed
+CACHE_NAME = ".s3sync_cache.json"
+
+_local = threading.local()
+
+
+def session():
+    """One requests.Session per worker thread (sessions are not thread-safe)."""
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+# =========================
+# MANIFEST
+# =========================
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan(directory, excludes):
+    """Relative paths (with '/' separators) of every file to sync."""
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not any(fnmatch.fnmatch(d, p) for p in excludes)]
+        for name in files:
+            rel = os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/")
+            if name == CACHE_NAME or any(fnmatch.fnmatch(rel, p) for p in excludes):
+                continue
+            yield rel
+
+
+def build_manifest(directory, prefix, excludes, workers):
+    """{key: {"key", "size", "sha256", "path"}}, hashing only files whose size or mtime changed."""
+    cache_path = os.path.join(directory, CACHE_NAME)
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    entries = {}
+    to_hash = []
+    for rel in scan(directory, excludes):
+        st = os.stat(os.path.join(directory, rel))
+        cached = cache.get(rel)
+        if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            entries[rel] = cached
+        else:
+            entries[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": None}
+            to_hash.append(rel)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for rel, digest in zip(to_hash, pool.map(lambda r: sha256_file(os.path.join(directory, r)), to_hash)):
+            entries[rel]["sha256"] = digest
+
+    with open(cache_path, "w") as f:
+        json.dump(entries, f)
+
+    print(f"[INFO] {len(entries)} files, {len(to_hash)} hashed ({len(entries) - len(to_hash)} from cache)")
+    return {
+        prefix + rel: {"key": prefix + rel, "size": e["size"], "sha256": e["sha256"], "path": os.path.join(directory, rel)}
+        for rel, e in entries.items()
+    }
+
+
+# =========================
+# TRANSFERS
+# =========================
+def upload(server, bucket, entry):
+    """Stream one file to the backend; dedup turns known content into a skip or server-side copy."""
+    content_type = mimetypes.guess_type(entry["key"])[0] or "application/octet-stream"
+    with open(entry["path"], "rb") as f:
+        res = session().put(
+            f"{server}/bucket/{bucket}/stream/{quote(entry['key'])}",
+            params={"dedup": "true"},
+            data=f,
+            headers={"Content-Type": content_type, "X-Content-SHA256": entry["sha256"]},
+        )
+    body = res.json()
+    if res.status_code != 200 or "detail" in body:
+        raise RuntimeError(f"{res.status_code}: {body.get('detail', res.text)}")
+    return body
+
+
+def delete(server, bucket, keys):
+    res = session().post(f"{server}/bucket/{bucket}/delete", json={"keys": keys})
+    body = res.json()
+    if res.status_code != 200 or "detail" in body:
+        raise RuntimeError(f"{res.status_code}: {body.get('detail', res.text)}")
+    return body
+
+
+# =========================
+# MAIN
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="Sync a local directory to an S3 bucket through backend_s3")
+    parser.add_argument("directory")
+    parser.add_argument("bucket")
+    parser.add_argument("--prefix", default="", help="key prefix in the bucket, e.g. site/")
+    parser.add_argument("--delete", action="store_true", help="delete objects under the prefix that are not local")
+    parser.add_argument("--exclude", action="append", default=[], help="glob to skip (repeatable)")
+    parser.add_argument("--workers", type=int, default=8, help="parallel hashes and uploads")
+    parser.add_argument("--server", default=SERVER_URL)
+    parser.add_argument("--dry-run", action="store_true", help="print the plan without transferring")
+    args = parser.parse_args()
+
+    if args.prefix and not args.prefix.endswith("/"):
+        args.prefix += "/"
+
+    start = time.perf_counter()
+    manifest = build_manifest(args.directory, args.prefix, args.exclude, args.workers)
+
+    res = requests.post(f"{args.server}/bucket/{args.bucket}/sync/plan", json={
+        "files": [{"key": e["key"], "size": e["size"], "sha256": e["sha256"]} for e in manifest.values()],
+        "prefix": args.prefix,
+        "delete": args.delete,
+    })
+    plan = res.json()
+    if res.status_code != 200 or "detail" in plan:
+        sys.exit(f"[ERROR] Plan failed ({res.status_code}): {plan.get('detail', res.text)}")
+    print(
+        f"[INFO] Plan: {len(plan['upload'])} to upload, {len(plan['delete'])} to delete, "
+        f"{plan['unchanged']} unchanged ({plan['seconds']}s on the server)"
+    )
+
+    if args.dry_run:
+        for key in plan["upload"]:
+            print(f"upload  {key}")
+        for key in plan["delete"]:
+            print(f"delete  {key}")
+        return
+
+    failures = 0
+    sent = saved = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(upload, args.server, args.bucket, manifest[key]): key for key in plan["upload"]}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                result = future.result()
+                outcome = result.get("dedup", "uploaded")
+                if outcome == "uploaded":
+                    sent += manifest[key]["size"]
+                else:
+                    saved += result.get("bytes_saved", 0)
+                print(f"[INFO] {outcome:<8} {key}")
+            except Exception as e:
+                failures += 1
+                print(f"[ERROR] upload {key}: {e}")
+
+    if plan["delete"]:
+        # One request; the backend splits it into concurrent 1000-key batches
+        try:
+            result = delete(args.server, args.bucket, plan["delete"])
+            failures += result["failed"]
+            for err in result["errors"]:
+                print(f"[ERROR] delete {err['key']}: {err['message']}")
+        except Exception as e:
+            failures += len(plan["delete"])
+            print(f"[ERROR] delete: {e}")
+
+    print(
+        f"[INFO] Done in {time.perf_counter() - start:.1f}s: {len(plan['upload'])} uploads "
+        f"({sent:,} bytes sent, {saved:,} saved by dedup), {len(plan['delete'])} deletes, {failures} failures"
+    )
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# Streamlit helpers shared by the EC2 and S3 dashboards
+import json
+import time
+from collections import deque
+
+import requests
+import streamlit as st
+
+
+def follow_job(base_url, job_id, tail=200):
+    """Stream a job's Terraform output into the page; return the final job state."""
+    log_box = st.empty()
+    status_box = st.empty()
+    lines = deque(maxlen=tail)
+    last_output = last_render = time.time()
+    event = None
+    with requests.get(f"{base_url}/jobs/{job_id}/stream", stream=True, timeout=(5, 60)) as res:
+        res.raise_for_status()
+        for raw in res.iter_lines(decode_unicode=True):
+            if raw.startswith(":"):
+                status_box.caption(f"⏳ No new output for {time.time() - last_output:.0f}s")
+            elif raw.startswith("event:"):
+                event = raw[len("event:"):].strip()
+            elif raw.startswith("data:"):
+                data = raw[len("data:"):].removeprefix(" ")
+                if event == "end":
+                    log_box.code("\n".join(lines))
+                    status_box.empty()
+                    return json.loads(data)
+                lines.append(data)
+                last_output = time.time()
+                if last_output - last_render > 0.25:
+                    log_box.code("\n".join(lines))
+                    status_box.empty()
+                    last_render = last_output
+            elif not raw:
+                event = None
+    return requests.get(f"{base_url}/jobs/{job_id}").json()
@@ -0,0 +1,467 @@
+# Terraform job runner shared by the EC2 and S3 backends: each backend runs
+# Terraform through start_job() and mounts `router` for the /jobs endpoints.
+import asyncio
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# ========== CONFIG ==========
+# Max Terraform processes running at once, and how many finished jobs to keep
+TF_MAX_JOBS = int(os.getenv("TF_MAX_JOBS", "4"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "200"))
+# Output lines kept per job for late subscribers, and SSE heartbeat interval
+JOB_LOG_LINES = int(os.getenv("JOB_LOG_LINES", "500"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "5"))
+
+# Provider plugin cache shared by the EC2 and S3 modules, so `terraform init`
+# links already-downloaded providers instead of fetching them again. Fresh
+# workspaces have no .terraform.lock.hcl, and Terraform >= 1.4 bypasses the
+# cache for providers without a lock file checksum unless told otherwise.
+TF_PLUGIN_CACHE_DIR = os.getenv(
+    "TF_PLUGIN_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".terraform.d", "plugin-cache")
+)
+os.makedirs(TF_PLUGIN_CACHE_DIR, exist_ok=True)
+# Added to the environment of every terraform process. The environment itself
+# is read per run, so settings a backend loads after import (.env) still apply.
+TF_ENV_OVERRIDES = {
+    "TF_PLUGIN_CACHE_DIR": TF_PLUGIN_CACHE_DIR,
+    "TF_PLUGIN_CACHE_MAY_BREAK_DEPENDENCY_LOCK_FILE": "1",
+    "TF_IN_AUTOMATION": "1",
+}
+
+
+# ========== JOBS ==========
+
+# Terraform runs in this bounded pool so the event loop (and every open
+# WebSocket or upload) stays responsive while resources are provisioned.
+tf_executor = ThreadPoolExecutor(max_workers=TF_MAX_JOBS, thread_name_prefix="terraform")
+jobs = {}
+_dir_locks = {}
+init_stats = {"hits": 0, "misses": 0, "seconds": 0.0}
+
+
+class JobLog:
+    """Bounded ring buffer of output lines; readers resume from a sequence number."""
+
+    def __init__(self, maxlen=JOB_LOG_LINES):
+        self.lines = deque(maxlen=maxlen)
+        self.next_seq = 0
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def append(self, line):
+        self.lines.append((self.next_seq, line))
+        self.next_seq += 1
+        self._wake()
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, since=0):
+        """Yield (seq, line) from `since` onwards; yields None as a heartbeat when idle."""
+        while True:
+            changed = self._changed
+            first = self.next_seq - len(self.lines)
+            if since < first:
+                yield first - 1, f"[... {first - since} earlier lines dropped ...]"
+                since = first
+            if since < self.next_seq:
+                seq, line = self.lines[since - first]
+                yield seq, line
+                since = seq + 1
+                continue
+            if self.closed:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), JOB_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+
+
+class Job:
+    """A background Terraform job, queryable via /jobs/{id}."""
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.exit_code = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.timings = {}
+        self.log = JobLog()
+        self.task = None
+
+    @property
+    def done(self):
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self):
+        duration = None
+        if self.started_at:
+            duration = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "exit_code": self.exit_code,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": duration,
+            "timings": self.timings,
+        }
+
+
+def dir_lock(path):
+    """One lock per Terraform working directory (one state file, one writer)."""
+    return _dir_locks.setdefault(path, asyncio.Lock())
+
+
+def forget_dir_lock(path):
+    """Drop the lock of a working directory that was removed or renamed."""
+    _dir_locks.pop(path, None)
+
+
+def run_terraform(args, cwd, on_line=None):
+    """Run a single terraform command, passing each output line to on_line. Blocking."""
+    cmd = ["terraform", args[0], "-no-color", *args[1:]]
+    proc = subprocess.Popen(
+        cmd, cwd=cwd, env={**os.environ, **TF_ENV_OVERRIDES}, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        text=True, encoding="utf-8", errors="replace", bufsize=1,
+    )
+    stderr_tail = deque(maxlen=50)
+
+    def drain_stderr():
+        for line in proc.stderr:
+            stderr_tail.append(line)
+            if on_line:
+                on_line(line.rstrip("\n"))
+
+    err_thread = threading.Thread(target=drain_stderr, daemon=True)
+    err_thread.start()
+    for line in proc.stdout:
+        if on_line:
+            on_line(line.rstrip("\n"))
+    err_thread.join()
+    returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, None, "".join(stderr_tail))
+
+
+async def terraform(job, *args, cwd):
+    """Run terraform in the worker pool, streaming its output into the job log."""
+    loop = asyncio.get_running_loop()
+    job.log.append(f"$ terraform {' '.join(args)}")
+    start = time.perf_counter()
+    try:
+        await loop.run_in_executor(
+            tf_executor, run_terraform, list(args), cwd,
+            lambda line: loop.call_soon_threadsafe(job.log.append, line),
+        )
+        job.exit_code = 0
+    except subprocess.CalledProcessError as e:
+        job.exit_code = e.returncode
+        raise
+    finally:
+        step = args[0]
+        job.timings[step] = round(job.timings.get(step, 0) + time.perf_counter() - start, 3)
+
+
+class PluginCacheLock:
+    """Exclusive lock on the plugin cache, shared with the other backend process.
+
+    Terraform does not support concurrent `terraform init` runs writing to one
+    plugin cache. Blocking; call acquire() off the event loop.
+    """
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, ".plugin-cache.lock")
+        self._file = None
+
+    def acquire(self):
+        f = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        self._file = f
+
+    def release(self):
+        f, self._file = self._file, None
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        f.close()
+
+
+# One `terraform init` at a time: the asyncio lock orders inits within this
+# process, the file lock orders them against the other backend
+_init_lock = asyncio.Lock()
+plugin_cache_lock = PluginCacheLock(TF_PLUGIN_CACHE_DIR)
+
+
+def config_hash(cwd, args):
+    """Hash of the init arguments, every *.tf file and the provider lock file."""
+    digest = hashlib.sha256(" ".join(args).encode())
+    for name in sorted(os.listdir(cwd)):
+        if name.endswith((".tf", ".tf.json")) or name == ".terraform.lock.hcl":
+            digest.update(name.encode())
+            with open(os.path.join(cwd, name), "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+async def terraform_init(job, *args, cwd):
+    """`terraform init`, skipped when nothing it depends on changed since the last success."""
+    marker = os.path.join(cwd, ".terraform", "init.sha256")
+    try:
+        with open(marker) as f:
+            cached = f.read().strip()
+    except OSError:
+        cached = None
+
+    if cached and cached == config_hash(cwd, args):
+        init_stats["hits"] += 1
+        job.timings["init"] = 0.0
+        job.log.append("terraform init skipped: configuration and lock file unchanged")
+        outcome = "cache hit"
+    else:
+        loop = asyncio.get_running_loop()
+        async with _init_lock:
+            await loop.run_in_executor(None, plugin_cache_lock.acquire)
+            try:
+                start = time.perf_counter()
+                await terraform(job, "init", "-input=false", *args, cwd=cwd)
+                elapsed = time.perf_counter() - start
+            finally:
+                plugin_cache_lock.release()
+        with open(marker, "w") as f:
+            f.write(config_hash(cwd, args))
+        init_stats["misses"] += 1
+        init_stats["seconds"] += elapsed
+        outcome = f"ran in {elapsed:.1f}s"
+
+    total = init_stats["hits"] + init_stats["misses"]
+    print(f"[INFO] terraform init in {cwd}: {outcome} (cache hit rate {init_stats['hits'] / total:.0%})")
+
+
+async def _run_job(job, fn, *args):
+    job.status = "running"
+    job.started_at = time.time()
+    try:
+        job.result = await fn(job, *args)
+        job.status = "succeeded"
+    except subprocess.CalledProcessError as e:
+        job.status = "failed"
+        job.error = f"Terraform error: {(e.stderr or str(e)).strip()}"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        job.finished_at = time.time()
+        job.log.close()
+        print(f"[INFO] Job {job.id} ({job.kind}) {job.status} in {job.finished_at - job.started_at:.1f}s")
+
+
+def start_job(kind, fn, *args):
+    """Schedule fn(job, *args) in the background and return the job at once."""
+    finished = [j for j in jobs.values() if j.done]
+    for old in sorted(finished, key=lambda j: j.created_at)[:max(0, len(finished) - JOB_HISTORY)]:
+        jobs.pop(old.id, None)
+
+    job = Job(kind)
+    jobs[job.id] = job
+    job.task = asyncio.create_task(_run_job(job, fn, *args))
+    return job
+
+
+# ========== READINESS ==========
+
+async def wait_until(probe, timeout, what, job=None, *, initial_delay, max_delay):
+    """Await probe() until it returns a truthy value, backing off exponentially.
+
+    Delays start at initial_delay and double up to max_delay; each backend
+    picks them for what it waits on. Raises TimeoutError once `timeout`
+    seconds have passed without success.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    attempt = 1
+    while True:
+        result = await probe()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Timed out after {timeout:.0f}s waiting for {what}")
+        if job is not None:
+            job.log.append(f"Waiting for {what} (attempt {attempt}, retry in {delay:.1f}s)")
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+        attempt += 1
+
+
+# ========== ROUTES ==========
+
+router = APIRouter()
+
+
+@router.get("/jobs/")
+async def list_jobs():
+    """All tracked jobs, newest first."""
+    ordered = sorted(jobs.values(), key=lambda j: j.created_at, reverse=True)
+    return {"jobs": [j.to_dict() for j in ordered]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status, exit code, result and timings of one job."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, since: int = 0, last_event_id: Optional[str] = Header(None)):
+    """Server-Sent Events feed of a job's Terraform output, ending with the final job state."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id) + 1
+
+    async def events():
+        async for item in job.log.follow(since):
+            if item is None:
+                yield ": heartbeat\n\n"
+                continue
+            seq, line = item
+            yield f"id: {seq}\ndata: {line}\n\n"
+        yield f"event: end\ndata: {json.dumps(job.to_dict())}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/terraform/stats")
+async def terraform_stats():
+    """How often `terraform init` was skipped, and time spent when it was not."""
+    total = init_stats["hits"] + init_stats["misses"]
+    return {
+        **init_stats,
+        "hit_rate": init_stats["hits"] / total if total else None,
+        "plugin_cache_dir": TF_PLUGIN_CACHE_DIR,
+    }
+
+
+# ========== OUTPUTS ==========
+
+class OutputsCache:
+    """Terraform outputs read straight from terraform.tfstate.
+
+    The state file is only re-parsed when its mtime or size changes, so
+    reading an output costs a stat() instead of a `terraform output` fork.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, workspace):
+        """{"serial": ..., "outputs": {...}} for a workspace, or None without state."""
+        state = os.path.join(workspace, "terraform.tfstate")
+        try:
+            st = os.stat(state)
+        except OSError:
+            self._entries.pop(state, None)
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._entries.get(state)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        try:
+            with open(state, encoding="utf-8") as f:
+                data = json.load(f)
+        except ValueError:
+            # Terraform is mid-write; serve the previous parse until it settles
+            return cached[1] if cached else None
+        entry = {
+            "serial": data.get("serial"),
+            "outputs": {
+                name: None if out.get("sensitive") else out.get("value")
+                for name, out in data.get("outputs", {}).items()
+            },
+        }
+        self._entries[state] = (stamp, entry)
+        return entry
+
+
+def workspaces_router(workspaces_dir, id_field, outputs_cache):
+    """Routes listing the workspaces under workspaces_dir and their outputs.
+
+    Each backend names its workspaces after a different thing (request ID,
+    bucket name); id_field is the key that name is reported under.
+    """
+    ws_router = APIRouter()
+
+    @ws_router.get("/outputs")
+    async def all_outputs():
+        """Outputs of every workspace, read from cached state (no Terraform processes)."""
+        if not os.path.isdir(workspaces_dir):
+            return {"workspaces": {}}
+        result = {}
+        for name in sorted(os.listdir(workspaces_dir)):
+            state = outputs_cache.get(os.path.join(workspaces_dir, name))
+            if state is not None:
+                result[name] = state
+        return {"workspaces": result}
+
+    @ws_router.get("/workspaces/")
+    async def list_workspaces():
+        """Workspaces on disk, whether they hold state and whether a job is running in them."""
+        if not os.path.isdir(workspaces_dir):
+            return {"workspaces": []}
+        return {
+            "workspaces": [
+                {
+                    id_field: name,
+                    "has_state": os.path.exists(os.path.join(workspaces_dir, name, "terraform.tfstate")),
+                    "busy": dir_lock(os.path.join(workspaces_dir, name)).locked(),
+                }
+                for name in sorted(os.listdir(workspaces_dir))
+            ]
+        }
+
+    return ws_router